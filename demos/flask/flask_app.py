@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 
 import logging
-from fhirclient import client
+import copy
+import functools
+import math
+import itertools
+from types import MappingProxyType
+from fhirclient import client, server as fhirserver
 from fhirclient.models.medication import Medication
 from fhirclient.models.medicationrequest import MedicationRequest
 from fhirclient.models.observation import Observation
@@ -9,6 +14,7 @@ from fhirclient.models.condition import Condition
 from fhirclient.models.allergyintolerance import AllergyIntolerance
 from fhirclient.models.procedure import Procedure
 from fhirclient.models.diagnosticreport import DiagnosticReport
+from fhirclient.models.bundle import Bundle, BundleEntry, BundleEntryRequest
 from fhirclient.models.fhirdate import FHIRDate
 from fhirclient.models.quantity import Quantity
 from fhirclient.models.codeableconcept import CodeableConcept
@@ -16,35 +22,94 @@ from fhirclient.models.coding import Coding
 from fhirclient.models.fhirreference import FHIRReference
 from fhirclient.models.fhirdatetime import FHIRDateTime
 
-from flask import Flask, request, redirect, session, jsonify
+from flask import Flask, request, redirect, session, jsonify, g, render_template, make_response, has_request_context
+from flask.json.provider import DefaultJSONProvider
+from itsdangerous import BadSignature, URLSafeTimedSerializer
 from flask_cors import CORS, cross_origin
-from datetime import datetime, timedelta
-import urllib.parse
-import json
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+import base64
+import orjson
 import secrets
 import uuid
 import threading
+import queue
+import atexit
+import time
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+from pymongo import MongoClient, UpdateOne, DeleteOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, OperationFailure
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
 
 # Load environment variables from .env file
 load_dotenv()
 
 # MongoDB connection for session storage
+MONGODB_URI = os.environ.get('MONGODB_URI', 'mongodb://localhost:27017/')
+# Pool sized for one Gunicorn worker's threads; compress the (large) FHIR
+# state blobs on the wire
+_MONGO_CLIENT_OPTIONS = MappingProxyType({
+    'maxPoolSize': 20,
+    'minPoolSize': 2,
+    'waitQueueTimeoutMS': 1000,
+    'serverSelectionTimeoutMS': 5000,
+    'retryWrites': True,
+    'compressors': 'zstd,zlib'
+})
+_client_by_pid = {}
+_client_by_pid_lock = threading.Lock()
+
+def get_mongo():
+    """Return this process's `MongoClient`, shared by all its threads
+    
+    A client must not be used across `fork()` (Gunicorn's `preload_app`
+    imports this module in the master), so each worker creates its own.
+    """
+    pid = os.getpid()
+    mongo = _client_by_pid.get(pid)
+    if mongo is None:
+        with _client_by_pid_lock:
+            mongo = _client_by_pid.get(pid)
+            if mongo is None:
+                mongo = _client_by_pid[pid] = MongoClient(MONGODB_URI, **_MONGO_CLIENT_OPTIONS)
+    return mongo
+
+def _sessions():
+    """The sessions collection, through this process's client"""
+    return get_mongo()['fhir_sessions']['sessions']
+
 try:
-    MONGODB_URI = os.environ.get('MONGODB_URI', 'mongodb://localhost:27017/')
-    mongo_client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
+    mongo_client = get_mongo()
     # Test connection
     mongo_client.admin.command('ping')
+    # Only for setup and storage-mode checks; after a fork request-time code
+    # must go through `_sessions()` / `get_mongo()`
     db = mongo_client['fhir_sessions']
     sessions_collection = db['sessions']
     print(f"Connected to MongoDB at {MONGODB_URI}")
     
     # Create index for better performance
     sessions_collection.create_index("token", unique=True)
-    sessions_collection.create_index("expires_at")
+    # TTL index: MongoDB removes expired sessions in the background
+    try:
+        sessions_collection.create_index("expires_at", expireAfterSeconds=0)
+    except OperationFailure:
+        # Convert the plain `expires_at` index created by older versions
+        try:
+            db.command('collMod', 'sessions', index={'keyPattern': {'expires_at': 1}, 'expireAfterSeconds': 0})
+        except OperationFailure as e:
+            # MongoDB < 5.1, or no collMod permission: keep MongoDB storage;
+            # expired sessions are still rejected on read, just not reaped
+            print(f"⚠️ Warning: could not make the expires_at index a TTL index, expired sessions won't be removed automatically: {e}")
+    # Serves the session list's newest-first sort and its expiry filter from
+    # the index, so paging never sorts or skips over documents in memory
+    sessions_collection.create_index([('_id', -1), ('expires_at', 1)], name='active_newest_first')
+    # Resolves OAuth state nonces on callbacks that arrive without a cookie
+    sessions_collection.create_index('data.oauth_nonce', sparse=True)
     
 except Exception as e:
     print(f"MongoDB connection failed, using in-memory storage: {e}")
@@ -58,129 +123,416 @@ if mongo_client is not None and db is not None:
 else:
     print("⚠️ Warning: MongoDB not available, using in-memory storage only")
 
-# Multi-session storage with MongoDB support
-active_sessions = {} if sessions_collection is None else None
-session_tokens = {} if sessions_collection is None else None
+# Multi-session storage: MongoDB when available, otherwise in-memory. The
+# helper implementations are picked once at import (see below), so session
+# accesses don't have to check which storage is in use.
+active_sessions = {}
 session_lock = threading.Lock()
 
-# Maximum number of concurrent sessions
-MAX_SESSIONS = 100000000000000000000000
+# `last_accessed` is only refreshed once it is older than this many seconds
+SESSION_ACCESS_REFRESH_INTERVAL = 60
+
+# In-process cache of MongoDB session data (including the OAuth tokens),
+# keyed by token and holding `(rev, data)` as last read from MongoDB. Every
+# write stamps the document with a new `rev`, and a cached entry is only
+# used once a lookup of just that field confirms MongoDB still holds the
+# same revision. Logins and logouts on other workers are therefore seen on
+# the next request, while the large FHIR state isn't re-read unchanged.
+#
+# `SESSION_CACHE_TTL` bounds how long an idle session's data stays cached.
+# It is kept below `SESSION_ACCESS_REFRESH_INTERVAL`, so the copy a
+# `last_accessed` refresh starts from is never older than the refresh
+# interval: values of 60 seconds and more are clamped to 59.
+SESSION_CACHE_TTL = int(os.environ.get('SESSION_CACHE_TTL', 30))
+if SESSION_CACHE_TTL >= SESSION_ACCESS_REFRESH_INTERVAL:
+    print(f"⚠️ Warning: SESSION_CACHE_TTL={SESSION_CACHE_TTL} must be below "
+          f"{SESSION_ACCESS_REFRESH_INTERVAL}, using {SESSION_ACCESS_REFRESH_INTERVAL - 1}")
+    SESSION_CACHE_TTL = SESSION_ACCESS_REFRESH_INTERVAL - 1
+_SESSION_CACHE = TTLCache(maxsize=10000, ttl=SESSION_CACHE_TTL)
+_session_cache_lock = threading.Lock()
+# Sessions with writes queued in this process, as `token: [count, data]`;
+# until the writes land this view is newer than MongoDB's (`data` is None
+# for a deleted session)
+_pending_sessions = {}
+
+# How long a session lives without being logged out
+SESSION_TTL = timedelta(hours=2)
+
+# Session data fields mirrored at the top level of the MongoDB document,
+# where the TTL index and the listing queries see them
+_SESSION_DOC_FIELDS = ('expires_at', 'created_at', 'last_accessed')
+
+def _utcnow():
+    """Naive UTC time, the form MongoDB (and its TTL index) stores and
+    returns; local wall-clock times would skew expiry by the UTC offset"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# Write-behind queue of `(token, write)` pairs, drained by `_session_writer`.
+# A write holds the data fields to set on an existing session, or is None
+# to delete the session. New sessions don't go through it (see
+# `_mongo_save_session`).
+_session_write_queue = queue.Queue()
+_session_writer_pid = None
+_session_writer_lock = threading.Lock()
+SESSION_WRITE_BATCH_SIZE = 500
+SESSION_WRITE_INTERVAL = 0.05
+SESSION_WRITE_MAX_ATTEMPTS = 5
+# Writes whose flush failed, as `token: [write, count, attempts]`. They are
+# older than anything still queued, so the next flush starts from them.
+_session_write_retries = {}
+_session_flush_lock = threading.Lock()
+
+def _session_memo():
+    """Per-request memo of session lookups, or None outside a request"""
+    if not has_request_context():
+        return None
+    if '_session_docs' not in g:
+        g._session_docs = {}
+    return g._session_docs
 
 # MongoDB session helper functions
-def get_session_from_db(token):
-    """Get session data from MongoDB or in-memory storage"""
-    if sessions_collection is None:
-        return active_sessions.get(token)
-    
+def _mongo_get_session(token):
+    """Get session data from MongoDB, at most once per request"""
+    memo = _session_memo()
+    if memo is not None and token in memo:
+        return memo[token]
+    data = _mongo_load_session(token)
+    if memo is not None:
+        memo[token] = data
+    return data
+
+def _mongo_load_session(token):
+    """Get session data from pending writes, the validated cache or MongoDB"""
     try:
-        session_doc = sessions_collection.find_one({'token': token})
-        if session_doc and session_doc.get('expires_at', datetime.now()) > datetime.now():
-            return session_doc['data']
-        elif session_doc:
+        now = _utcnow()
+        with _session_cache_lock:
+            pending = _pending_sessions.get(token)
+            entry = _SESSION_CACHE.get(token)
+        
+        if pending is not None:
+            data = pending[1]
+        else:
+            data = None
+            if entry is not None:
+                session_doc = _sessions().find_one({'token': token}, {'rev': 1, '_id': 0})
+                if session_doc is None:
+                    with _session_cache_lock:
+                        _SESSION_CACHE.pop(token, None)
+                    return None
+                if session_doc.get('rev') == entry[0]:
+                    data = entry[1]
+            if data is None:
+                session_doc = _sessions().find_one({'token': token}, {'data': 1, 'rev': 1, '_id': 0})
+                if session_doc is None:
+                    return None
+                data = session_doc['data']
+                with _session_cache_lock:
+                    _SESSION_CACHE[token] = (session_doc.get('rev'), data)
+        
+        if data is not None and data.get('expires_at', now) <= now:
             # Clean up expired session
-            sessions_collection.delete_one({'token': token})
-        return None
+            _mongo_delete_session(token)
+            return None
+        return data
     except Exception as e:
         print(f"Error getting session from DB: {e}")
         return None
 
-def save_session_to_db(token, data):
-    """Save session data to MongoDB or in-memory storage"""
-    if sessions_collection is None:
-        active_sessions[token] = data
-        return
+def _mongo_save_session(token, data):
+    """Save a new session to MongoDB
     
+    New sessions are written straight away rather than queued: the next
+    request may land on another worker, which has to find the session in
+    MongoDB or it would start yet another one.
+    """
     try:
-        session_doc = {
-            'token': token,
-            'data': data,
-            'expires_at': data.get('expires_at', datetime.now() + timedelta(hours=2)),
-            'created_at': data.get('created_at', datetime.now()),
-            'last_accessed': datetime.now()
-        }
-        sessions_collection.replace_one(
-            {'token': token}, 
-            session_doc, 
-            upsert=True
-        )
+        update = _session_update(data, new=True)
+        _sessions().update_one({'token': token}, update, upsert=True)
+        with _session_cache_lock:
+            _SESSION_CACHE[token] = (update['$set']['rev'], data)
+        memo = _session_memo()
+        if memo is not None:
+            memo[token] = data
     except Exception as e:
         print(f"Error saving session to DB: {e}")
 
-def delete_session_from_db(token):
-    """Delete session from MongoDB or in-memory storage"""
-    if sessions_collection is None:
-        if token in active_sessions:
-            del active_sessions[token]
-        if token in session_tokens:
-            del session_tokens[token]
-        return
-    
+def _mongo_update_session(token, fields):
+    """Set the given session data fields in MongoDB, leaving the others as
+    they are there"""
     try:
-        sessions_collection.delete_one({'token': token})
+        data = _mongo_get_session(token)
+        if data is not None:
+            _enqueue_session_write(token, fields, {**data, **fields})
     except Exception as e:
-        print(f"Error deleting session from DB: {e}")
+        print(f"Error updating session in DB: {e}")
 
-def get_all_sessions():
-    """Get all active sessions"""
-    if sessions_collection is None:
-        return active_sessions or {}
-    
+def _mongo_delete_session(token):
+    """Delete session from MongoDB"""
     try:
-        sessions = {}
-        for doc in sessions_collection.find({'expires_at': {'$gt': datetime.now()}}):
-            sessions[doc['token']] = doc['data']
-        return sessions
+        _enqueue_session_write(token, None, None)
     except Exception as e:
-        print(f"Error getting all sessions from DB: {e}")
-        return {}
+        print(f"Error deleting session from DB: {e}")
 
-def find_session_by_oauth_state(oauth_state):
-    """Find session by OAuth state parameter for callback recovery"""
-    if not oauth_state:
-        return None
+def _enqueue_session_write(token, write, data):
+    """Queue a session write for the background writer of this process
+    
+    :param write: The session data fields to set, or None to delete the
+        session
+    :param data: The session as it stands after the write, None if deleted
+    """
+    global _session_writer_pid
+    # Threads don't survive a fork, so each Gunicorn worker starts its own
+    if _session_writer_pid != os.getpid():
+        with _session_writer_lock:
+            if _session_writer_pid != os.getpid():
+                threading.Thread(target=_session_writer, name='session-writer', daemon=True).start()
+                _session_writer_pid = os.getpid()
     
-    if sessions_collection is None:
-        # Search in-memory storage
-        if active_sessions:
-            for token, data in active_sessions.items():
-                if data.get('oauth_state') == oauth_state:
-                    return token
+    with _session_cache_lock:
+        pending = _pending_sessions.setdefault(token, [0, None])
+        pending[0] += 1
+        pending[1] = data
+        _SESSION_CACHE.pop(token, None)
+    memo = _session_memo()
+    if memo is not None:
+        memo[token] = data
+    # The writer encodes the write later, so queue a copy the request can't
+    # change under it
+    _session_write_queue.put((token, copy.deepcopy(write)))
+
+def _merge_session_writes(earlier, later):
+    """Combine two queued writes to one session into a single write"""
+    if earlier is None or later is None:
+        # Updates must not revive a deleted session
         return None
+    return {**earlier, **later}
+
+def _session_update(fields, new=False):
+    """`$set` update writing session data fields, stamped with a new `rev`
+    
+    :param new: Whether `fields` are the whole data of a new session
+    """
+    if new:
+        update = {'data': fields}
+    else:
+        update = {f'data.{field}': value for field, value in fields.items()}
+    update.update((field, fields[field]) for field in _SESSION_DOC_FIELDS if field in fields)
+    update['rev'] = uuid.uuid4().hex
+    return {'$set': update}
+
+def _session_write_operation(token, write):
+    """The `bulk_write` operation carrying out one merged session write"""
+    if write is None:
+        return DeleteOne({'token': token})
+    return UpdateOne({'token': token}, _session_update(write))
+
+def _settle_session_writes(counts):
+    """Forget pending writes that have been sent, given `token: count`"""
+    with _session_cache_lock:
+        for token, count in counts.items():
+            pending = _pending_sessions.get(token)
+            if pending is not None:
+                pending[0] -= count
+                if pending[0] <= 0:
+                    del _pending_sessions[token]
+
+def _flush_session_writes():
+    """Send up to `SESSION_WRITE_BATCH_SIZE` queued writes in one `bulk_write`
+    
+    Failed writes are retried on the following flushes, up to
+    `SESSION_WRITE_MAX_ATTEMPTS` times each.
+    """
+    with _session_flush_lock:
+        writes = dict(_session_write_retries)
+        _session_write_retries.clear()
+        while len(writes) < SESSION_WRITE_BATCH_SIZE:
+            try:
+                token, write = _session_write_queue.get_nowait()
+            except queue.Empty:
+                break
+            # Writes to one session fold into a single operation, which also
+            # makes the unordered bulk write safe
+            if token in writes:
+                writes[token][0] = _merge_session_writes(writes[token][0], write)
+                writes[token][1] += 1
+            else:
+                writes[token] = [write, 1, 0]
+        
+        if not writes:
+            return 0
+        tokens = list(writes)
+        failed = set()
+        try:
+            _sessions().bulk_write(
+                [_session_write_operation(token, writes[token][0]) for token in tokens],
+                ordered=False
+            )
+        except BulkWriteError as e:
+            print(f"Error flushing session writes to DB: {e}")
+            failed = {tokens[error['index']] for error in e.details.get('writeErrors', ())}
+        except Exception as e:
+            print(f"Error flushing session writes to DB: {e}")
+            failed = set(tokens)
+        
+        settled = {}
+        for token in tokens:
+            write, count, attempts = writes[token]
+            if token in failed and attempts + 1 < SESSION_WRITE_MAX_ATTEMPTS:
+                _session_write_retries[token] = [write, count, attempts + 1]
+                continue
+            if token in failed:
+                print(f"Giving up on writing session {token[:8]}... to DB")
+            settled[token] = count
+        # Once given up on, a session is read back from MongoDB again rather
+        # than served as if the write had landed
+        _settle_session_writes(settled)
+        return len(writes)
+
+def _session_writer():
+    """Background thread draining the session write queue"""
+    while True:
+        time.sleep(SESSION_WRITE_INTERVAL)
+        _flush_session_writes()
+
+def _drain_session_writes():
+    """Flush pending session writes before the process exits"""
+    while _flush_session_writes():
+        pass
+
+# Session fields shown by the sessions debug listing
+_SESSION_SUMMARY_FIELDS = ('session_id', 'created_at', 'last_accessed', 'expires_at', 'access_token')
+_SESSION_SUMMARY_PROJECTION = {'token': 1, '_id': 0, **{f'data.{field}': 1 for field in _SESSION_SUMMARY_FIELDS}}
+
+def _mongo_iter_session_summaries(offset=0, limit=None):
+    """Yield `(token, summary)` for active sessions, newest first, fetching
+    only the summary fields from MongoDB
     
+    :param offset: Number of sessions to skip
+    :param limit: Yield at most this many sessions
+    """
     try:
-        # Search MongoDB
-        session_doc = sessions_collection.find_one({
-            'data.oauth_state': oauth_state,
-            'expires_at': {'$gt': datetime.now()}
-        })
-        if session_doc:
-            return session_doc['token']
-        return None
+        cursor = _sessions().find(
+            {'expires_at': {'$gt': _utcnow()}},
+            _SESSION_SUMMARY_PROJECTION,
+            batch_size=128
+        ).sort('_id', -1).skip(offset)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        for doc in cursor:
+            yield doc['token'], doc.get('data', {})
     except Exception as e:
-        app.logger.error(f"Error finding session by OAuth state: {e}")
-        return None
+        print(f"Error iterating sessions from DB: {e}")
 
-def cleanup_expired_sessions_db():
-    """Clean up expired sessions from MongoDB or in-memory storage"""
-    if sessions_collection is None:
-        # Fallback to in-memory cleanup
-        if active_sessions:
-            now = datetime.now()
-            expired_tokens = [
-                token for token, data in active_sessions.items()
-                if now > data.get('expires_at', now)
-            ]
-            for token in expired_tokens:
-                if token in active_sessions:
-                    del active_sessions[token]
-        return
-    
+def _mongo_count_sessions():
+    """Number of active sessions in MongoDB"""
+    try:
+        return _sessions().count_documents({'expires_at': {'$gt': _utcnow()}})
+    except Exception as e:
+        print(f"Error counting sessions in DB: {e}")
+        return 0
+
+def _mongo_count_expired_sessions():
+    """Number of expired sessions the TTL monitor has yet to remove"""
+    try:
+        return _sessions().count_documents({'expires_at': {'$lte': _utcnow()}})
+    except Exception as e:
+        print(f"Error counting expired sessions in DB: {e}")
+        return 0
+
+def _mongo_find_session_token_by_oauth_nonce(nonce):
+    """Token of the active session holding the given OAuth state nonce"""
     try:
-        result = sessions_collection.delete_many({'expires_at': {'$lte': datetime.now()}})
-        if result.deleted_count > 0:
-            print(f"Cleaned up {result.deleted_count} expired sessions from MongoDB")
+        session_doc = _sessions().find_one(
+            {'data.oauth_nonce': nonce, 'expires_at': {'$gt': _utcnow()}},
+            {'token': 1, '_id': 0}
+        )
+        return session_doc['token'] if session_doc else None
     except Exception as e:
-        print(f"Error cleaning up expired sessions: {e}")
+        print(f"Error finding session by OAuth nonce in DB: {e}")
+        return None
+
+def _mongo_cleanup_expired_sessions():
+    """Nothing to do: the TTL index on `expires_at` lets MongoDB reap expired
+    sessions itself"""
+
+# In-memory session helper functions
+def _memory_get_session(token):
+    """Get session data from in-memory storage"""
+    return active_sessions.get(token)
+
+def _memory_save_session(token, data):
+    """Save session data to in-memory storage"""
+    active_sessions[token] = data
+
+def _memory_update_session(token, fields):
+    """Set the given session data fields in in-memory storage"""
+    data = active_sessions.get(token)
+    if data is not None:
+        data.update(fields)
+
+def _memory_delete_session(token):
+    """Delete session from in-memory storage"""
+    active_sessions.pop(token, None)
+
+def _memory_iter_session_summaries(offset=0, limit=None):
+    """Yield `(token, data)` for active in-memory sessions, newest first"""
+    now = _utcnow()
+    active = (
+        (token, data) for token, data in reversed(list(active_sessions.items()))
+        if now <= data.get('expires_at', now)
+    )
+    yield from itertools.islice(active, offset, None if limit is None else offset + limit)
+
+def _memory_count_sessions():
+    """Number of active in-memory sessions"""
+    now = _utcnow()
+    return sum(1 for data in list(active_sessions.values()) if now <= data.get('expires_at', now))
+
+def _memory_count_expired_sessions():
+    """Number of expired in-memory sessions not yet cleaned up"""
+    now = _utcnow()
+    return sum(1 for data in list(active_sessions.values()) if now > data.get('expires_at', now))
+
+def _memory_find_session_token_by_oauth_nonce(nonce):
+    """Token of the active in-memory session holding the given OAuth nonce"""
+    now = _utcnow()
+    for token, data in list(active_sessions.items()):
+        if data.get('oauth_nonce') == nonce and now <= data.get('expires_at', now):
+            return token
+    return None
+
+def _memory_cleanup_expired_sessions():
+    """Clean up expired sessions from in-memory storage"""
+    now = _utcnow()
+    with session_lock:
+        expired_tokens = [
+            token for token, data in list(active_sessions.items())
+            if now > data.get('expires_at', now)
+        ]
+        for token in expired_tokens:
+            active_sessions.pop(token, None)
+
+if sessions_collection is not None:
+    get_session_from_db = _mongo_get_session
+    save_session_to_db = _mongo_save_session
+    update_session_in_db = _mongo_update_session
+    delete_session_from_db = _mongo_delete_session
+    iter_session_summaries = _mongo_iter_session_summaries
+    count_sessions = _mongo_count_sessions
+    count_expired_sessions = _mongo_count_expired_sessions
+    find_session_token_by_oauth_nonce = _mongo_find_session_token_by_oauth_nonce
+    cleanup_expired_sessions_db = _mongo_cleanup_expired_sessions
+    atexit.register(_drain_session_writes)
+else:
+    get_session_from_db = _memory_get_session
+    save_session_to_db = _memory_save_session
+    update_session_in_db = _memory_update_session
+    delete_session_from_db = _memory_delete_session
+    iter_session_summaries = _memory_iter_session_summaries
+    count_sessions = _memory_count_sessions
+    count_expired_sessions = _memory_count_expired_sessions
+    find_session_token_by_oauth_nonce = _memory_find_session_token_by_oauth_nonce
+    cleanup_expired_sessions_db = _memory_cleanup_expired_sessions
 
 # app setup with complete OAuth scopes for Epic FHIR
 smart_defaults = {
@@ -203,11 +555,43 @@ smart_defaults = {
         'launch/patient',
     ])
 }
+# Read-only view merged into each new client's settings
+_SMART_DEFAULTS_TEMPLATE = MappingProxyType(smart_defaults)
 
 # Use environment variable for client redirect URL in production
 CLIENT_REDIRECT_URL = os.environ.get('CLIENT_REDIRECT_URL', 'http://localhost:8080/fhir')
 
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider using orjson for request parsing and `jsonify`"""
+    
+    def _dump_bytes(self, obj, indent=False):
+        # Dict keys stay sorted like Flask's default provider, except inside
+        # dataclasses (e.g. ObservationSummary rows), which orjson writes in
+        # field order. Types orjson doesn't handle natively go through
+        # Flask's default conversion. Naive datetimes are UTC throughout, so
+        # they are labelled as such.
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option)
+    
+    def dumps(self, obj, **kwargs):
+        return self._dump_bytes(obj, indent=bool(kwargs.get('indent'))).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # `jsonify` hands orjson's UTF-8 bytes straight to the response
+        # instead of decoding them to str only for Werkzeug to re-encode
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self._dump_bytes(obj, indent) + b"\n", mimetype=self.mimetype)
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 
 # ===== PRODUCTION-READY SESSION CONFIGURATION =====
 # Use environment variables for production settings
@@ -226,6 +610,18 @@ app.config.update(
     SESSION_PERMANENT=False,  # Non-permanent sessions
 )
 
+# Compile the dashboard templates up front; with Gunicorn's `preload_app` the
+# workers inherit them instead of each parsing them on its first request
+app.jinja_env.get_template('index.html')
+app.jinja_env.get_template('error.html')
+
+# Signs per-session nonces into OAuth `state` values for callback recovery.
+# The state travels through Epic, browser history and logs, so it carries a
+# nonce rather than the session token, and stops being honoured after
+# `OAUTH_STATE_MAX_AGE` seconds.
+_oauth_state_serializer = URLSafeTimedSerializer(app.secret_key, salt='oauth-state')
+OAUTH_STATE_MAX_AGE = 900
+
 # Initialize custom MongoDB session interface instead of flask-session
 if mongo_client is not None and db is not None:
     print("✅ MongoDB available - using Flask built-in sessions with MongoDB storage")
@@ -251,7 +647,7 @@ def after_request(response):
         response.headers['Access-Control-Allow-Methods'] = 'GET,PUT,POST,DELETE,OPTIONS,PATCH,HEAD'
         response.headers['Access-Control-Expose-Headers'] = 'Set-Cookie,X-Session-Token'
     except Exception as e:
-        app.logger.error(f"Error in after_request: {e}")
+        app.logger.error("Error in after_request: %s", e)
     return response
 
 @app.before_request
@@ -265,15 +661,15 @@ def handle_preflight():
             response.headers['Access-Control-Allow-Methods'] = 'GET,PUT,POST,DELETE,OPTIONS,PATCH,HEAD'
             return response
     except Exception as e:
-        app.logger.error(f"Error in handle_preflight: {e}")
+        app.logger.error("Error in handle_preflight: %s", e)
 
 def generate_session_token():
     """Generate unique session token"""
     try:
         return secrets.token_urlsafe(32)
     except Exception as e:
-        app.logger.error(f"Error generating session token: {e}")
-        return f"token_{int(datetime.now().timestamp() * 1000)}"
+        app.logger.error("Error generating session token: %s", e)
+        return f"token_{int(time.time() * 1000)}"
 
 def get_session_token():
     """Get session token from request headers or create new one"""
@@ -291,50 +687,51 @@ def get_session_token():
         # Create new token if none exists or is invalid
         return create_new_session()
     except Exception as e:
-        app.logger.error(f"Error getting session token: {e}")
+        app.logger.error("Error getting session token: %s", e)
         return create_new_session()
 
 def create_new_session():
     """Create a new isolated session"""
     try:
-        with session_lock:
-            # Clean up expired sessions first
-            cleanup_expired_sessions_db()
-            
-            # Generate new token and session
-            token = generate_session_token()
-            session_id = str(uuid.uuid4())
-            
-            session_data = {
-                'session_id': session_id,
-                'state': None,
-                'patient_data': None,
-                'access_token': None,
-                'refresh_token': None,
-                'token_expires_at': None,
-                'created_at': datetime.now(),
-                'expires_at': datetime.now() + timedelta(hours=2),
-                'last_accessed': datetime.now()
-            }
-            
-            # Save to MongoDB or in-memory storage
-            save_session_to_db(token, session_data)
-            
-            # Store in Flask-Session (MongoDB backed) for OAuth callback
-            session['session_token'] = token
-            
-            app.logger.info(f"Created new session: {token[:8]}... (ID: {session_id})")
-            return token
+        # Clean up expired in-memory sessions first (no-op with MongoDB)
+        cleanup_expired_sessions_db()
+        
+        # Generate new token and session. No other thread can know a token
+        # that was just generated, so creating the session needs no lock.
+        token = generate_session_token()
+        session_id = str(uuid.uuid4())
+        now = _utcnow()
+        
+        session_data = {
+            'session_id': session_id,
+            'state': None,
+            'patient_data': None,
+            'access_token': None,
+            'refresh_token': None,
+            'token_expires_at': None,
+            'created_at': now,
+            'expires_at': now + SESSION_TTL,
+            'last_accessed': now
+        }
+        
+        # Save to MongoDB or in-memory storage
+        save_session_to_db(token, session_data)
+        
+        # Store in Flask-Session (MongoDB backed) for OAuth callback
+        session['session_token'] = token
+        
+        app.logger.info("Created new session: %s... (ID: %s)", token[:8], session_id)
+        return token
     except Exception as e:
-        app.logger.error(f"Error creating new session: {e}")
-        return f"fallback_{int(datetime.now().timestamp() * 1000)}"
+        app.logger.error("Error creating new session: %s", e)
+        return f"fallback_{int(time.time() * 1000)}"
 
 def cleanup_expired_sessions():
     """Clean up expired sessions - delegates to MongoDB function"""
     try:
         cleanup_expired_sessions_db()
     except Exception as e:
-        app.logger.error(f"Error cleaning up expired sessions: {e}")
+        app.logger.error("Error cleaning up expired sessions: %s", e)
 
 def cleanup_session(token):
     """Clean up a specific session"""
@@ -343,47 +740,149 @@ def cleanup_session(token):
         if session_data:
             # Remove from storage (FHIR client cleanup happens automatically)
             delete_session_from_db(token)
-            app.logger.info(f"Cleaned up session: {token[:8]}...")
+            app.logger.info("Cleaned up session: %s...", token[:8])
     except Exception as e:
-        app.logger.error(f"Error cleaning up session {token}: {e}")
+        app.logger.error("Error cleaning up session %s: %s", token, e)
 
 def update_session_access(token):
-    """Update last accessed time for session"""
+    """Update last accessed time for session
+    
+    Skipped while `last_accessed` is younger than
+    `SESSION_ACCESS_REFRESH_INTERVAL`, so read traffic doesn't turn into a
+    session write on every call.
+    """
     try:
         session_data = get_session_from_db(token)
         if session_data:
-            session_data['last_accessed'] = datetime.now()
-            save_session_to_db(token, session_data)
+            now = _utcnow()
+            last_accessed = session_data.get('last_accessed')
+            if last_accessed and now - last_accessed < timedelta(seconds=SESSION_ACCESS_REFRESH_INTERVAL):
+                return
+            update_session_in_db(token, {'last_accessed': now})
     except Exception as e:
-        app.logger.error(f"Error updating session access: {e}")
+        app.logger.error("Error updating session access: %s", e)
 
 def _save_state(state, token):
     """Save FHIR client state for specific session"""
     try:
         session_data = get_session_from_db(token)
         if session_data:
-            session_data['state'] = state
-            session_data['last_accessed'] = datetime.now()
-            # Also save the OAuth state parameter for session recovery
-            if isinstance(state, dict) and 'state' in state:
-                session_data['oauth_state'] = state['state']
-            save_session_to_db(token, session_data)
-            app.logger.info(f"Saved state for session: {token[:8]}...")
+            update_session_in_db(token, {'state': state, 'last_accessed': _utcnow()})
+            app.logger.info("Saved state for session: %s...", token[:8])
     except Exception as e:
-        app.logger.error(f"Error saving state for {token}: {e}")
+        app.logger.error("Error saving state for %s: %s", token, e)
+
+def _bind_oauth_state(smart, token):
+    """Use a signed nonce, stored on the session, as the client's OAuth `state`
+    
+    The callback can then recover its session from the state alone, see
+    `find_session_by_oauth_state`.
+    """
+    try:
+        # Fetches the capability statement, which creates the auth instance
+        smart.prepare()
+        auth = smart.server.auth
+        if auth is not None and getattr(auth, 'auth_state', False) is None:
+            nonce = secrets.token_urlsafe(16)
+            update_session_in_db(token, {'oauth_nonce': nonce})
+            auth.auth_state = _oauth_state_serializer.dumps(nonce)
+            smart.save_state()
+    except Exception as e:
+        app.logger.error("Error binding OAuth state for %s...: %s", token[:8], e)
+
+def find_session_by_oauth_state(oauth_state):
+    """Recover the session token whose nonce is signed into an OAuth state
+    parameter, if the signature is valid and not older than
+    `OAUTH_STATE_MAX_AGE`"""
+    if not oauth_state:
+        return None
+    
+    try:
+        nonce = _oauth_state_serializer.loads(oauth_state, max_age=OAUTH_STATE_MAX_AGE)
+    except BadSignature:
+        return None
+    return find_session_token_by_oauth_nonce(nonce)
+
+# FHIR clients are rebuilt from session state on every request, each with a
+# fresh `requests.Session`; mounting one process-wide adapter lets them all
+# reuse the same pooled keep-alive connections to the FHIR server. It
+# carries fhirclient's own retry policy, as it replaces the library's
+# adapter on those sessions (fhirclient releases without one don't retry).
+_SHARED_ADAPTER = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    max_retries=getattr(fhirserver, 'FHIRRetryPolicy', 0)
+)
+
+def _use_shared_adapter(smart_client):
+    """Route the client's FHIR server requests through `_SHARED_ADAPTER`"""
+    session = smart_client.server.session if smart_client.server else None
+    if session is not None:
+        session.mount('https://', _SHARED_ADAPTER)
+        session.mount('http://', _SHARED_ADAPTER)
+    return smart_client
+
+# Client state with the FHIR server's capability statement already resolved
+# into its OAuth endpoints. New sessions start from a copy instead of each
+# downloading `/metadata` again. Every process loads it in the background on
+# first use, as the FHIR request has no timeout and must not stall imports
+# or requests, and refreshes it hourly.
+FHIR_BOOT_STATE = None
+FHIR_BOOT_STATE_REFRESH_INTERVAL = 3600
+_boot_state_refresher_pid = None
+_boot_state_lock = threading.Lock()
+
+def _load_fhir_boot_state():
+    """Fetch the capability statement once and keep the resulting client state"""
+    global FHIR_BOOT_STATE
+    try:
+        template = _use_shared_adapter(client.FHIRClient(
+            settings=dict(_SMART_DEFAULTS_TEMPLATE),
+            save_func=lambda state: None
+        ))
+        template.server.get_capability()
+        FHIR_BOOT_STATE = template.state
+    except Exception as e:
+        app.logger.error("Error preloading FHIR capability statement: %s", e)
+    return FHIR_BOOT_STATE
+
+def _refresh_fhir_boot_state():
+    """Timer callback reloading `FHIR_BOOT_STATE`, then rescheduling itself"""
+    _load_fhir_boot_state()
+    _schedule_fhir_boot_state_refresh()
+
+def _schedule_fhir_boot_state_refresh(delay=FHIR_BOOT_STATE_REFRESH_INTERVAL):
+    timer = threading.Timer(delay, _refresh_fhir_boot_state)
+    timer.daemon = True
+    timer.start()
+
+def _fhir_boot_state():
+    """Return a copy of the preloaded client state, or None until it has
+    been loaded"""
+    global _boot_state_refresher_pid
+    # Timers don't survive a fork, so each Gunicorn worker starts its own,
+    # with the first load due right away
+    if _boot_state_refresher_pid != os.getpid():
+        with _boot_state_lock:
+            if _boot_state_refresher_pid != os.getpid():
+                _schedule_fhir_boot_state_refresh(0)
+                _boot_state_refresher_pid = os.getpid()
+    state = FHIR_BOOT_STATE
+    return copy.deepcopy(state) if state is not None else None
 
 def _get_smart(token=None, force_new=False):
     """Get FHIR client for specific session"""
     try:
         if not token:
-            token = get_session_token()
+            token = _req_token()
         
         session_data = get_session_from_db(token)
         if not session_data:
             return None
         
         # Check if session is expired
-        if datetime.now() > session_data.get('expires_at', datetime.now()):
+        now = _utcnow()
+        if now > session_data.get('expires_at', now):
             cleanup_session(token)
             return None
         
@@ -397,80 +896,115 @@ def _get_smart(token=None, force_new=False):
                     save_func=lambda state: _save_state(state, token)
                 )
                 update_session_access(token)
-                app.logger.info(f"Recreated FHIR client from state for session: {token[:8]}...")
-                return smart_client
+                app.logger.info("Recreated FHIR client from state for session: %s...", token[:8])
+                return _use_shared_adapter(smart_client)
             except Exception as e:
-                app.logger.error(f"Error recreating FHIR client from state for {token}: {e}")
+                app.logger.error("Error recreating FHIR client from state for %s: %s", token, e)
                 # Fall through to create new client
         
-        # Create completely new FHIR client
-        settings = smart_defaults.copy()
-        # Create state with session ID and token for recovery
-        state_data = f"{session_data['session_id']}|{token}"
-        settings['state'] = state_data
+        # Create completely new FHIR client, from the preloaded state when
+        # available so it needn't fetch the capability statement itself
+        boot_state = _fhir_boot_state()
         
         try:
-            smart_client = client.FHIRClient(
-                settings=settings,
-                save_func=lambda state: _save_state(state, token)
-            )
+            if boot_state is not None:
+                smart_client = client.FHIRClient(
+                    state=boot_state,
+                    save_func=lambda state: _save_state(state, token)
+                )
+            else:
+                state_data = f"{session_data['session_id']}|{token}"
+                settings = {**_SMART_DEFAULTS_TEMPLATE, 'state': state_data}
+                smart_client = client.FHIRClient(
+                    settings=settings,
+                    save_func=lambda state: _save_state(state, token)
+                )
             update_session_access(token)
-            app.logger.info(f"Created new FHIR client for session: {token[:8]}...")
-            return smart_client
+            app.logger.info("Created new FHIR client for session: %s...", token[:8])
+            return _use_shared_adapter(smart_client)
         except Exception as e:
-            app.logger.error(f"Error creating FHIR client for {token}: {e}")
+            app.logger.error("Error creating FHIR client for %s: %s", token, e)
             return None
     except Exception as e:
-        app.logger.error(f"Error in _get_smart: {e}")
+        app.logger.error("Error in _get_smart: %s", e)
         return None
 
+@app.before_request
+def _peek_session_token():
+    """Record the session token the client presented, without any storage
+    lookup, for the error handlers to echo back"""
+    g.session_token = request.headers.get('X-Session-Token') or session.get('session_token')
+
+def _req_token():
+    """Session token for the current request, resolved at most once"""
+    if '_session_token' not in g:
+        g._session_token = g.session_token = get_session_token()
+    return g._session_token
+
+def _req_smart():
+    """FHIR client for the current request's session, built at most once"""
+    if '_smart' not in g:
+        g._smart = _get_smart(_req_token())
+    return g._smart
+
+def _req_now():
+    """Timezone-aware UTC time of the current request, read once"""
+    if '_now' not in g:
+        g._now = datetime.now(timezone.utc)
+    return g._now
+
 def _logout(token=None):
     """Logout specific session"""
     try:
         if not token:
-            token = get_session_token()
+            token = _req_token()
         
         if get_session_from_db(token):
             cleanup_session(token)
-            app.logger.info(f"Logged out session: {token[:8]}...")
+            app.logger.info("Logged out session: %s...", token[:8])
     except Exception as e:
-        app.logger.error(f"Error in logout: {e}")
+        app.logger.error("Error in logout: %s", e)
 
 def _reset_session(token=None):
     """Reset specific session"""
     try:
         if not token:
-            token = get_session_token()
+            token = _req_token()
         
         session_data = get_session_from_db(token)
         if session_data:
-            session_data['state'] = None
-            session_data['patient_data'] = None
-            session_data['access_token'] = None
-            session_data['refresh_token'] = None
-            session_data['token_expires_at'] = None
-            session_data['last_accessed'] = datetime.now()
-            save_session_to_db(token, session_data)
-            app.logger.info(f"Reset session: {token[:8]}...")
+            update_session_in_db(token, {
+                'state': None,
+                'patient_data': None,
+                'access_token': None,
+                'refresh_token': None,
+                'token_expires_at': None,
+                'last_accessed': _utcnow()
+            })
+            app.logger.info("Reset session: %s...", token[:8])
     except Exception as e:
-        app.logger.error(f"Error resetting session: {e}")
+        app.logger.error("Error resetting session: %s", e)
 
 def store_tokens(token, access_token, refresh_token=None, expires_in=None):
     """Store tokens for specific session"""
     try:
-        if token in active_sessions:
-            active_sessions[token]['access_token'] = access_token
-            active_sessions[token]['refresh_token'] = refresh_token
-            active_sessions[token]['token_expires_at'] = datetime.now() + timedelta(seconds=expires_in) if expires_in else None
-            update_session_access(token)
+        session_data = get_session_from_db(token)
+        if session_data:
+            now = _utcnow()
+            update_session_in_db(token, {
+                'access_token': access_token,
+                'refresh_token': refresh_token,
+                'token_expires_at': now + timedelta(seconds=expires_in) if expires_in else None,
+                'last_accessed': now
+            })
     except Exception as e:
-        app.logger.error(f"Error storing tokens for {token}: {e}")
+        app.logger.error("Error storing tokens for %s: %s", token, e)
 
 def get_tokens(token):
     """Retrieve stored tokens for specific session"""
     try:
-        if token in active_sessions:
-            session_data = active_sessions[token]
+        session_data = get_session_from_db(token)
+        if session_data:
             return {
                 'access_token': session_data.get('access_token'),
                 'refresh_token': session_data.get('refresh_token'),
@@ -478,27 +1012,39 @@ def get_tokens(token):
             }
         return None
     except Exception as e:
-        app.logger.error(f"Error retrieving tokens for {token}: {e}")
+        app.logger.error("Error retrieving tokens for %s: %s", token, e)
         return None
 
+# Month names for `_format_date`, avoiding a `strftime` call per date
+_MONTHS = ("January", "February", "March", "April", "May", "June", "July",
+           "August", "September", "October", "November", "December")
+
 # All the existing utility functions remain the same...
+@functools.lru_cache(maxsize=2048)
 def _format_date(date_str):
-    """Format FHIR date string to readable format"""
+    """Format FHIR date string to readable format
+    
+    Memoized, since many resources of one visit share the same timestamp.
+    """
     try:
         if not date_str:
             return "Unknown"
         
         if isinstance(date_str, str):
-            if len(date_str) == 10:  # YYYY-MM-DD
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-            else:  # Full datetime
-                date_obj = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-            return date_obj.strftime('%B %d, %Y')
+            # Only the date is shown, and a FHIR dateTime carries it as written
+            # before the 'T', so the time and zone need not be parsed
+            date_obj = date.fromisoformat(date_str.partition('T')[0])
+            return f"{_MONTHS[date_obj.month - 1]} {date_obj.day:02d}, {date_obj.year}"
         return str(date_str)
     except Exception as e:
-        app.logger.error(f"Error formatting date {date_str}: {e}")
+        app.logger.error("Error formatting date %s: %s", date_str, e)
         return str(date_str) if date_str else "Unknown"
 
+# Shared worker threads for concurrent FHIR requests. Fetches are blocking
+# HTTP calls, so threads overlap them without an async rewrite; threads are
+# only started on first use, i.e. inside each Gunicorn worker.
+_FHIR_POOL = ThreadPoolExecutor(max_workers=32, thread_name_prefix='fhir')
+
 def _get_patient_demographics(smart):
     """Get patient demographic information"""
     try:
@@ -511,19 +1057,19 @@ def _get_patient_demographics(smart):
         try:
             demographics['name'] = smart.human_name(patient.name[0] if patient.name and len(patient.name) > 0 else 'Unknown')
         except Exception as e:
-            app.logger.error(f"Error getting patient name: {e}")
+            app.logger.error("Error getting patient name: %s", e)
             demographics['name'] = 'Unknown'
             
         try:
             demographics['gender'] = patient.gender or 'Unknown'
         except Exception as e:
-            app.logger.error(f"Error getting patient gender: {e}")
+            app.logger.error("Error getting patient gender: %s", e)
             demographics['gender'] = 'Unknown'
             
         try:
             demographics['birth_date'] = _format_date(patient.birthDate.isostring if patient.birthDate else None)
         except Exception as e:
-            app.logger.error(f"Error getting patient birth date: {e}")
+            app.logger.error("Error getting patient birth date: %s", e)
             demographics['birth_date'] = 'Unknown'
         
         # Address
@@ -543,7 +1089,7 @@ def _get_patient_demographics(smart):
             else:
                 demographics['address'] = 'Not available'
         except Exception as e:
-            app.logger.error(f"Error getting patient address: {e}")
+            app.logger.error("Error getting patient address: %s", e)
             demographics['address'] = 'Not available'
         
         # Phone
@@ -554,106 +1100,210 @@ def _get_patient_demographics(smart):
             else:
                 demographics['phone'] = 'Not available'
         except Exception as e:
-            app.logger.error(f"Error getting patient phone: {e}")
+            app.logger.error("Error getting patient phone: %s", e)
             demographics['phone'] = 'Not available'
         
         return demographics
     except Exception as e:
-        app.logger.error(f"Error getting patient demographics: {e}")
+        app.logger.error("Error getting patient demographics: %s", e)
         return {'name': 'Unknown', 'gender': 'Unknown', 'birth_date': 'Unknown', 'address': 'Not available', 'phone': 'Not available'}
 
 def _get_prescriptions(smart):
     try:
         search = MedicationRequest.where({'patient': smart.patient_id})
-        prescriptions = list(search.perform_resources_iter(smart.server))
-        return [p for p in prescriptions if isinstance(p, MedicationRequest)]
+        return [p for p in search.perform_resources_iter(smart.server) if isinstance(p, MedicationRequest)]
     except Exception as e:
-        app.logger.error(f"Error getting prescriptions: {e}")
+        app.logger.error("Error getting prescriptions: %s", e)
         return []
 
 def _get_conditions(smart):
     """Get patient conditions/diagnoses"""
     try:
         search = Condition.where({'patient': smart.patient_id})
-        conditions = list(search.perform_resources_iter(smart.server))
-        return [c for c in conditions if isinstance(c, Condition)]
+        return [c for c in search.perform_resources_iter(smart.server) if isinstance(c, Condition)]
     except Exception as e:
-        app.logger.error(f"Error getting conditions: {e}")
+        app.logger.error("Error getting conditions: %s", e)
         return []
 
-def _get_observations(smart):
-    """Get patient observations/vitals"""
+# Number of (most recent) observations included in patient summaries
+SUMMARY_OBSERVATION_COUNT = 10
+
+def _observation_search(smart, limit=None):
+    """Search for patient observations, newest first
+    
+    With a `limit` the page size matches it, so the server sends no more
+    than that.
+    """
+    return Observation.where({'patient': smart.patient_id, '_count': str(limit or 50), '_sort': '-date'})
+
+def _get_observations(smart, limit=None):
+    """Get patient observations/vitals, newest first
+    
+    :param limit: Return at most this many, without paging past them
+    """
     try:
-        search = Observation.where({'patient': smart.patient_id, '_count': '50'})
-        observations = list(search.perform_resources_iter(smart.server))
-        return [o for o in observations if isinstance(o, Observation)]
+        search = _observation_search(smart, limit)
+        observations = (o for o in search.perform_resources_iter(smart.server) if isinstance(o, Observation))
+        return list(itertools.islice(observations, limit))
     except Exception as e:
-        app.logger.error(f"Error getting observations: {e}")
+        app.logger.error("Error getting observations: %s", e)
         return []
 
 def _get_allergies(smart):
     """Get patient allergies"""
     try:
         search = AllergyIntolerance.where({'patient': smart.patient_id})
-        allergies = list(search.perform_resources_iter(smart.server))
-        return [a for a in allergies if isinstance(a, AllergyIntolerance)]
+        return [a for a in search.perform_resources_iter(smart.server) if isinstance(a, AllergyIntolerance)]
     except Exception as e:
-        app.logger.error(f"Error getting allergies: {e}")
+        app.logger.error("Error getting allergies: %s", e)
         return []
 
 def _get_procedures(smart):
     """Get patient procedures"""
     try:
         search = Procedure.where({'patient': smart.patient_id})
-        procedures = list(search.perform_resources_iter(smart.server))
-        return [p for p in procedures if isinstance(p, Procedure)]
+        return [p for p in search.perform_resources_iter(smart.server) if isinstance(p, Procedure)]
     except Exception as e:
-        app.logger.error(f"Error getting procedures: {e}")
+        app.logger.error("Error getting procedures: %s", e)
         return []
 
+def _patient_searches(smart):
+    """The searches behind `_get_prescriptions` etc., keyed by result name
+    
+    :returns: Dict of (model, search, limit) tuples
+    """
+    return {
+        'prescriptions': (MedicationRequest, MedicationRequest.where({'patient': smart.patient_id}), None),
+        'conditions': (Condition, Condition.where({'patient': smart.patient_id}), None),
+        'observations': (Observation, _observation_search(smart, SUMMARY_OBSERVATION_COUNT), SUMMARY_OBSERVATION_COUNT),
+        'allergies': (AllergyIntolerance, AllergyIntolerance.where({'patient': smart.patient_id}), None),
+        'procedures': (Procedure, Procedure.where({'patient': smart.patient_id}), None),
+    }
+
+# HTTP statuses with which a server turns down batch interactions as such;
+# after one of them (or a malformed batch response) this process stops
+# trying, rather than paying for a failed POST on every request
+_BATCH_UNSUPPORTED_STATUSES = frozenset({400, 404, 405, 422, 501})
+_batch_unsupported = False
+
+def _get_patient_resources_batch(smart):
+    """Run all patient searches as one FHIR batch interaction
+    
+    Raises if the server rejects the batch or any of its searches, so callers
+    can fall back to individual searches.
+    
+    :returns: Dict of resource lists keyed like `_patient_searches`
+    """
+    searches = _patient_searches(smart)
+    
+    batch = Bundle()
+    batch.type = 'batch'
+    batch.entry = []
+    for model, search, limit in searches.values():
+        entry = BundleEntry()
+        entry.request = BundleEntryRequest()
+        entry.request.method = 'GET'
+        entry.request.url = search.construct()
+        batch.entry.append(entry)
+    
+    global _batch_unsupported
+    try:
+        response = smart.server.post_json('', batch.as_json())
+    except Exception as e:
+        if getattr(getattr(e, 'response', None), 'status_code', None) in _BATCH_UNSUPPORTED_STATUSES:
+            _batch_unsupported = True
+        raise
+    result = Bundle(response.json(), strict=False)
+    entries = result.entry or []
+    if len(entries) != len(searches):
+        _batch_unsupported = True
+        raise Exception(f"Batch returned {len(entries)} entries for {len(searches)} searches")
+    
+    resources = {}
+    for (name, (model, search, limit)), entry in zip(searches.items(), entries):
+        status = entry.response.status if entry.response else ''
+        if not status.startswith('2') or not isinstance(entry.resource, Bundle):
+            raise Exception(f"Batch search for {name} failed with status {status or 'unknown'}")
+        
+        page = entry.resource
+        if limit is None and any(link.relation == 'next' for link in page.link or []):
+            # More than one page: let the regular search follow the paging links
+            found = search.perform_resources_iter(smart.server)
+        else:
+            found = (e.resource for e in page.entry or [])
+        resources[name] = list(itertools.islice((r for r in found if isinstance(r, model)), limit))
+    return resources
+
 def _get_medication_by_ref(ref, smart):
     try:
         med_id = ref.split("/")[1]
         return Medication.read(med_id, smart.server).code
     except Exception as e:
-        app.logger.error(f"Error getting medication by ref: {e}")
+        app.logger.error("Error getting medication by ref: %s", e)
         return None
 
+def _prefetch_medications(prescriptions, smart):
+    """Read every distinct referenced Medication once, concurrently
+    
+    :returns: Dict mapping medication reference to its code
+    """
+    refs = list({
+        p.medicationReference.reference for p in prescriptions
+        if isinstance(p, MedicationRequest) and p.medicationCodeableConcept is None
+        and p.medicationReference is not None and p.medicationReference.reference
+    })
+    if not refs:
+        return {}
+    
+    codes = _FHIR_POOL.map(lambda ref: _get_medication_by_ref(ref, smart), refs)
+    return dict(zip(refs, codes))
+
+RXNORM_SYSTEM = 'http://www.nlm.nih.gov/research/umls/rxnorm'
+
 def _med_name(med):
     try:
         if not med:
             return "Unknown Medication"
         
         if hasattr(med, 'coding') and med.coding:
-            name = next((coding.display for coding in med.coding if coding.system == 'http://www.nlm.nih.gov/research/umls/rxnorm'), None)
+            name = next((coding.display for coding in med.coding if coding.system == RXNORM_SYSTEM), None)
             if name:
                 return name
         if hasattr(med, 'text') and med.text:
             return med.text
         return "Unnamed Medication(TM)"
     except Exception as e:
-        app.logger.error(f"Error getting medication name: {e}")
+        app.logger.error("Error getting medication name: %s", e)
         return "Unknown Medication"
 
-def _get_med_name(prescription, client=None):
+def _get_med_name(prescription, client=None, medications=None):
+    """Get the display name for a prescription's medication
+    
+    `medications` may hold codes from `_prefetch_medications`, saving a
+    Medication read per prescription.
+    """
     try:
         if not isinstance(prescription, MedicationRequest):
-            app.logger.error(f"Expected MedicationRequest, got {type(prescription)}")
+            app.logger.error("Expected MedicationRequest, got %s", type(prescription))
             return "Error: Invalid prescription data"
         
         if prescription.medicationCodeableConcept is not None:
             med = prescription.medicationCodeableConcept
             return _med_name(med)
         elif prescription.medicationReference is not None and client is not None:
-            med = _get_medication_by_ref(prescription.medicationReference.reference, client)
+            ref = prescription.medicationReference.reference
+            if medications is not None and ref in medications:
+                med = medications[ref]
+            else:
+                med = _get_medication_by_ref(ref, client)
             return _med_name(med)
         else:
             return 'Error: medication not found'
     except AttributeError as e:
-        app.logger.error(f"AttributeError in _get_med_name: {e}")
+        app.logger.error("AttributeError in _get_med_name: %s", e)
         return "Error: Unable to retrieve medication name"
     except Exception as e:
-        app.logger.error(f"Unexpected error in _get_med_name: {e}")
+        app.logger.error("Unexpected error in _get_med_name: %s", e)
         return "Error: Medication processing failed"
 
 def _format_condition(condition):
@@ -676,7 +1326,7 @@ def _format_condition(condition):
         
         return f"{name} (Status: {status}, Onset: {onset})"
     except Exception as e:
-        app.logger.error(f"Error formatting condition: {e}")
+        app.logger.error("Error formatting condition: %s", e)
         return "Error: Unable to format condition"
 
 def _format_observation(obs):
@@ -703,7 +1353,7 @@ def _format_observation(obs):
         
         return f"{name}: {value} ({date})"
     except Exception as e:
-        app.logger.error(f"Error formatting observation: {e}")
+        app.logger.error("Error formatting observation: %s", e)
         return "Error: Unable to format observation"
 
 def _format_allergy(allergy):
@@ -721,7 +1371,7 @@ def _format_allergy(allergy):
         severity = allergy.criticality or "Unknown severity"
         return f"{substance} (Severity: {severity})"
     except Exception as e:
-        app.logger.error(f"Error formatting allergy: {e}")
+        app.logger.error("Error formatting allergy: %s", e)
         return "Error: Unable to format allergy"
 
 def _format_procedure(procedure):
@@ -739,29 +1389,52 @@ def _format_procedure(procedure):
         date = _format_date(procedure.performedDateTime.isostring if procedure.performedDateTime else None)
         return f"{name} ({date})"
     except Exception as e:
-        app.logger.error(f"Error formatting procedure: {e}")
+        app.logger.error("Error formatting procedure: %s", e)
         return "Error: Unable to format procedure"
 
 def _get_complete_patient_data(smart):
     """Get all patient data for redirect"""
     try:
-        demographics = _get_patient_demographics(smart)
-        prescriptions = _get_prescriptions(smart)
-        conditions = _get_conditions(smart)
-        observations = _get_observations(smart)
-        allergies = _get_allergies(smart)
-        procedures = _get_procedures(smart)
-        
+        # Fetch everything in one batch request, falling back to concurrent
+        # individual searches if the server can't handle the batch
+        fetchers = {
+            'prescriptions': _get_prescriptions,
+            'conditions': _get_conditions,
+            'observations': functools.partial(_get_observations, limit=SUMMARY_OBSERVATION_COUNT),
+            'allergies': _get_allergies,
+            'procedures': _get_procedures,
+        }
+        demographics_future = _FHIR_POOL.submit(_get_patient_demographics, smart)
+        results = None
+        if not _batch_unsupported:
+            try:
+                results = _get_patient_resources_batch(smart)
+            except Exception as e:
+                app.logger.warning("Batch fetch failed, using individual searches: %s", e)
+        if results is None:
+            results = {}
+            futures = {_FHIR_POOL.submit(fetch, smart): name for name, fetch in fetchers.items()}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        demographics = demographics_future.result()
+        
+        prescriptions = results['prescriptions']
+        conditions = results['conditions']
+        observations = results['observations']
+        allergies = results['allergies']
+        procedures = results['procedures']
+        
+        med_codes = _prefetch_medications(prescriptions, smart)
         medications = []
         for prescription in prescriptions:
             try:
-                med_name = _get_med_name(prescription, smart)
+                med_name = _get_med_name(prescription, smart, med_codes)
                 medications.append({
                     'name': med_name,
                     'status': prescription.status if hasattr(prescription, 'status') else "Unknown status"
                 })
             except Exception as e:
-                app.logger.error(f"Error processing prescription: {e}")
+                app.logger.error("Error processing prescription: %s", e)
                 medications.append({
                     'name': "Error processing medication",
                     'status': "Error"
@@ -773,11 +1446,11 @@ def _get_complete_patient_data(smart):
             'medications': medications,
             'conditions': [_format_condition(condition) for condition in conditions],
             'allergies': [_format_allergy(allergy) for allergy in allergies],
-            'observations': [_format_observation(obs) for obs in observations[:10]],
+            'observations': [_format_observation(obs) for obs in observations],
             'procedures': [_format_procedure(procedure) for procedure in procedures]
         }
     except Exception as e:
-        app.logger.error(f"Error getting complete patient data: {e}")
+        app.logger.error("Error getting complete patient data: %s", e)
         return {
             'patient_id': 'unknown',
             'demographics': {'name': 'Unknown', 'gender': 'Unknown', 'birth_date': 'Unknown', 'address': 'Not available', 'phone': 'Not available'},
@@ -788,70 +1461,139 @@ def _get_complete_patient_data(smart):
             'procedures': []
         }
 
+def _count_patient_resources(smart, model):
+    """Number of `model` resources for the patient, from a `_summary=count`
+    search; servers that leave out `Bundle.total` get a full search"""
+    try:
+        search = model.where({'patient': smart.patient_id, '_summary': 'count'})
+        total = smart.server.request_json(search.construct()).get('total')
+        if total is not None:
+            return total
+        search = model.where({'patient': smart.patient_id})
+        return sum(1 for r in search.perform_resources_iter(smart.server) if isinstance(r, model))
+    except Exception as e:
+        app.logger.error("Error counting %s resources: %s", model.resource_type, e)
+        return 0
+
+def _get_patient_summary(smart):
+    """Demographics plus medication and condition counts, without fetching
+    the resources themselves"""
+    demographics = _FHIR_POOL.submit(_get_patient_demographics, smart)
+    medications_count = _FHIR_POOL.submit(_count_patient_resources, smart, MedicationRequest)
+    conditions_count = _FHIR_POOL.submit(_count_patient_resources, smart, Condition)
+    return {
+        'patient_id': smart.patient_id,
+        'demographics': demographics.result(),
+        'medications_count': medications_count.result(),
+        'conditions_count': conditions_count.result()
+    }
+
+# Epic-compatible LOINC templates with dummy values
+_LOINC_TEMPLATES = MappingProxyType({
+    "temperature": {
+        "code": "8310-5", 
+        "display": "Body temperature", 
+        "unit": "Cel", 
+        "dummy": 36.5
+    },
+    "systolic_bp": {
+        "code": "8480-6", 
+        "display": "Systolic blood pressure", 
+        "unit": "mm[Hg]", 
+        "dummy": 120
+    },
+    "diastolic_bp": {
+        "code": "8462-4", 
+        "display": "Diastolic blood pressure", 
+        "unit": "mm[Hg]", 
+        "dummy": 80
+    },
+    "heart_rate": {
+        "code": "8867-4", 
+        "display": "Heart rate", 
+        "unit": "/min", 
+        "dummy": 72
+    },
+    "respiratory_rate": {
+        "code": "9279-1", 
+        "display": "Respiratory rate", 
+        "unit": "/min", 
+        "dummy": 16
+    },
+    "oxygen_saturation": {
+        "code": "2708-6", 
+        "display": "Oxygen saturation in Arterial blood", 
+        "unit": "%", 
+        "dummy": 98
+    },
+    "weight": {
+        "code": "29463-7", 
+        "display": "Body weight", 
+        "unit": "kg", 
+        "dummy": 70
+    },
+    "height": {
+        "code": "8302-2", 
+        "display": "Body height", 
+        "unit": "cm", 
+        "dummy": 175
+    },
+    "bmi": {
+        "code": "39156-5", 
+        "display": "Body mass index (BMI) [Ratio]", 
+        "unit": "kg/m2", 
+        "dummy": 23.5
+    }
+})
+_DEFAULT_LOINC = _LOINC_TEMPLATES["temperature"]
+
+# Plausible values per observation type, in the template's unit
+_VALID_RANGE = MappingProxyType({
+    "temperature": (30.0, 45.0),
+    "systolic_bp": (40.0, 300.0),
+    "diastolic_bp": (20.0, 200.0),
+    "heart_rate": (20.0, 250.0),
+    "respiratory_rate": (5.0, 60.0),
+    "oxygen_saturation": (50.0, 100.0),
+    "weight": (0.5, 500.0),
+    "height": (20.0, 260.0),
+    "bmi": (5.0, 80.0)
+})
+_DEFAULT_VALID_RANGE = (0.0, 1000.0)
+
+LOINC_SYSTEM = sys.intern("http://loinc.org")
+UCUM_SYSTEM = sys.intern("http://unitsofmeasure.org")
+OBSERVATION_CATEGORY_SYSTEM = sys.intern("http://terminology.hl7.org/CodeSystem/observation-category")
+_VITAL_SIGNS = sys.intern("vital-signs")
+_STATUS_FINAL = sys.intern("final")
+
+# Epic requires category 'vital-signs' for observations; the same (read-only)
+# concept is shared by every observation created
+_VITAL_SIGNS_CATEGORY = CodeableConcept()
+_vital_signs_coding = Coding()
+_vital_signs_coding.system = OBSERVATION_CATEGORY_SYSTEM
+_vital_signs_coding.code = _VITAL_SIGNS
+_vital_signs_coding.display = "Vital Signs"
+_VITAL_SIGNS_CATEGORY.coding = [_vital_signs_coding]
+
+@functools.lru_cache(maxsize=64)
+def _loinc_code_concept(code, display):
+    """Prototype LOINC `CodeableConcept` for `code`; callers copy it before
+    setting per-observation fields and must not modify its `coding` list."""
+    coding = Coding()
+    coding.system = LOINC_SYSTEM
+    coding.code = code
+    coding.display = display
+    concept = CodeableConcept()
+    concept.coding = [coding]
+    return concept
+
 def _create_new_observation(smart, observation_data):
     """Create a new observation with Epic FHIR requirements and comprehensive dummy defaults"""
     try:
-        # Epic-compatible LOINC templates with dummy values
-        loinc_templates = {
-            "temperature": {
-                "code": "8310-5", 
-                "display": "Body temperature", 
-                "unit": "Cel", 
-                "dummy": 36.5
-            },
-            "systolic_bp": {
-                "code": "8480-6", 
-                "display": "Systolic blood pressure", 
-                "unit": "mm[Hg]", 
-                "dummy": 120
-            },
-            "diastolic_bp": {
-                "code": "8462-4", 
-                "display": "Diastolic blood pressure", 
-                "unit": "mm[Hg]", 
-                "dummy": 80
-            },
-            "heart_rate": {
-                "code": "8867-4", 
-                "display": "Heart rate", 
-                "unit": "/min", 
-                "dummy": 72
-            },
-            "respiratory_rate": {
-                "code": "9279-1", 
-                "display": "Respiratory rate", 
-                "unit": "/min", 
-                "dummy": 16
-            },
-            "oxygen_saturation": {
-                "code": "2708-6", 
-                "display": "Oxygen saturation in Arterial blood", 
-                "unit": "%", 
-                "dummy": 98
-            },
-            "weight": {
-                "code": "29463-7", 
-                "display": "Body weight", 
-                "unit": "kg", 
-                "dummy": 70
-            },
-            "height": {
-                "code": "8302-2", 
-                "display": "Body height", 
-                "unit": "cm", 
-                "dummy": 175
-            },
-            "bmi": {
-                "code": "39156-5", 
-                "display": "Body mass index (BMI) [Ratio]", 
-                "unit": "kg/m2", 
-                "dummy": 23.5
-            }
-        }
-
         # Get observation type or default to temperature
         obs_type = str(observation_data.get("type", "temperature")).lower()
-        template = loinc_templates.get(obs_type, loinc_templates["temperature"])
+        template = _LOINC_TEMPLATES.get(obs_type, _DEFAULT_LOINC)
 
         # Use provided values or fallback to template defaults
         obs_code = observation_data.get("code") or template["code"]
@@ -863,32 +1605,26 @@ def _create_new_observation(smart, observation_data):
         obs_value = observation_data.get("value")
         try:
             obs_value = float(obs_value)
-            # Sanity check for reasonable values
-            if obs_value <= 0 or obs_value > 1000:  
+            # Sanity check for reasonable values; a caller-supplied unit may
+            # not match the per-type range, so fall back to the generic one
+            if obs_unit == template["unit"]:
+                lo, hi = _VALID_RANGE.get(obs_type, _DEFAULT_VALID_RANGE)
+            else:
+                lo, hi = _DEFAULT_VALID_RANGE
+            if not (lo <= obs_value <= hi and math.isfinite(obs_value)):
                 obs_value = template["dummy"]
         except (ValueError, TypeError):
             obs_value = template["dummy"]
 
         # Create Observation resource
         new_obs = Observation()
-        new_obs.status = "final"
+        new_obs.status = _STATUS_FINAL
 
         # Epic requires category 'vital-signs' for observations
-        category = CodeableConcept()
-        cat_coding = Coding()
-        cat_coding.system = "http://terminology.hl7.org/CodeSystem/observation-category"
-        cat_coding.code = "vital-signs"
-        cat_coding.display = "Vital Signs"
-        category.coding = [cat_coding]
-        new_obs.category = [category]
+        new_obs.category = [_VITAL_SIGNS_CATEGORY]
 
         # Set observation code with LOINC
-        code = CodeableConcept()
-        coding = Coding()
-        coding.system = "http://loinc.org"
-        coding.code = obs_code
-        coding.display = obs_display
-        code.coding = [coding]
+        code = copy.copy(_loinc_code_concept(obs_code, obs_display))
         code.text = obs_name
         new_obs.code = code
 
@@ -896,7 +1632,7 @@ def _create_new_observation(smart, observation_data):
         quantity = Quantity()
         quantity.value = obs_value
         quantity.unit = obs_unit
-        quantity.system = "http://unitsofmeasure.org"
+        quantity.system = UCUM_SYSTEM
         quantity.code = obs_unit  # UCUM code
         new_obs.valueQuantity = quantity
 
@@ -907,7 +1643,7 @@ def _create_new_observation(smart, observation_data):
 
         # Set effective date
         effective = FHIRDateTime()
-        effective.date = datetime.now()
+        effective.date = _req_now()
         new_obs.effectiveDateTime = effective
 
         # Create in Epic FHIR server
@@ -915,7 +1651,7 @@ def _create_new_observation(smart, observation_data):
         return result
 
     except Exception as e:
-        app.logger.error(f"Error creating observation: {e}")
+        app.logger.error("Error creating observation: %s", e)
         raise e
 
 def _update_observation(smart, observation_id, observation_data):
@@ -942,9 +1678,48 @@ def _update_observation(smart, observation_id, observation_data):
         return result
         
     except Exception as e:
-        app.logger.error(f"Error updating observation: {e}")
+        app.logger.error("Error updating observation: %s", e)
         raise e
 
+@dataclass(frozen=True)
+class ObservationSummary:
+    """Row of the observation list response; orjson serializes it natively"""
+    __slots__ = ('id', 'name', 'value', 'unit', 'date', 'category')
+    id: str
+    name: str
+    value: str
+    unit: str
+    date: str
+    category: str
+
+def _obs_summary(obs, _fmt=_format_date):
+    """Editable summary of an Observation, as an `ObservationSummary`"""
+    effective = obs.effectiveDateTime
+    code = getattr(obs, 'code', None)
+    coding = (code and code.coding) or ()
+    name = (code and code.text) or (coding[0].display if coding else None) or 'Unknown observation'
+    
+    value, unit = 'No value', ''
+    vq = getattr(obs, 'valueQuantity', None)
+    if vq:
+        value = str(vq.value) if vq.value is not None else ''
+        unit = vq.unit or ''
+    elif obs.valueString:
+        value = obs.valueString
+    else:
+        vcc = getattr(obs, 'valueCodeableConcept', None)
+        if vcc and vcc.text:
+            value = vcc.text
+    
+    return ObservationSummary(
+        id=obs.id,
+        name=name,
+        value=value,
+        unit=unit,
+        date=_fmt(effective.isostring if effective else None),
+        category='vital-signs'
+    )
+
 # ===== MULTI-SESSION API ENDPOINTS =====
 
 @app.route('/api/auth-status')
@@ -952,8 +1727,8 @@ def _update_observation(smart, observation_id, observation_data):
 def api_auth_status():
     """Check authentication status for current session"""
     try:
-        token = get_session_token()
-        smart = _get_smart(token)
+        token = _req_token()
+        smart = _req_smart()
         
         if smart and smart.ready and smart.patient:
             return jsonify({
@@ -967,7 +1742,7 @@ def api_auth_status():
             'session_token': token
         })
     except Exception as e:
-        app.logger.error(f"Error in auth-status: {e}")
+        app.logger.error("Error in auth-status: %s", e)
         token = create_new_session()
         return jsonify({
             'authenticated': False,
@@ -983,6 +1758,8 @@ def api_auth_url():
         # Create new session for OAuth flow
         token = create_new_session()
         smart = _get_smart(token, force_new=True)
+        if smart:
+            _bind_oauth_state(smart, token)
         
         if smart and smart.authorize_url:
             response = jsonify({
@@ -991,11 +1768,13 @@ def api_auth_url():
                 'state': smart.state if hasattr(smart, 'state') else None
             })
             response.headers['X-Session-Token'] = token
+            # Every call mints a new session and OAuth state
+            response.headers['Cache-Control'] = 'no-store'
             return response
         
         return jsonify({'error': 'No authorization URL available'}), 400
     except Exception as e:
-        app.logger.error(f"Error in auth-url: {e}")
+        app.logger.error("Error in auth-url: %s", e)
         return jsonify({'error': f'Failed to generate auth URL: {str(e)}'}), 500
 
 @app.route('/api/patient-data')
@@ -1003,8 +1782,8 @@ def api_auth_url():
 def api_patient_data():
     """Get complete patient data as JSON for current session"""
     try:
-        token = get_session_token()
-        smart = _get_smart(token)
+        token = _req_token()
+        smart = _req_smart()
         
         if not smart or not smart.patient:
             return jsonify({'error': 'No patient data available'}), 404
@@ -1013,7 +1792,7 @@ def api_patient_data():
         data['session_token'] = token
         return jsonify(data)
     except Exception as e:
-        app.logger.error(f"Error getting patient data: {e}")
+        app.logger.error("Error getting patient data: %s", e)
         return jsonify({'error': 'Failed to retrieve patient data', 'details': str(e)}), 500
 
 @app.route('/api/observations', methods=['GET'])
@@ -1021,59 +1800,45 @@ def api_patient_data():
 def get_observations():
     """Get detailed patient observations with IDs for editing"""
     try:
-        token = get_session_token()
-        smart = _get_smart(token)
+        token = _req_token()
+        smart = _req_smart()
         
         if not smart or not smart.patient:
             return jsonify({'error': 'No patient data available'}), 404
         
-        observations = _get_observations(smart)
-        detailed_obs = []
-        
-        for obs in observations:
-            try:
-                if isinstance(obs, Observation):
-                    obs_data = {
-                        'id': obs.id,
-                        'name': 'Unknown observation',
-                        'value': 'No value',
-                        'unit': '',
-                        'date': _format_date(obs.effectiveDateTime.isostring if obs.effectiveDateTime else None),
-                        'category': 'vital-signs'
-                    }
-                    
-                    # Get observation name
-                    if obs.code and obs.code.text:
-                        obs_data['name'] = obs.code.text
-                    elif obs.code and obs.code.coding:
-                        obs_data['name'] = obs.code.coding[0].display or "Unknown observation"
-                    
-                    # Get observation value
-                    if obs.valueQuantity:
-                        obs_data['value'] = str(obs.valueQuantity.value) if obs.valueQuantity.value else ''
-                        obs_data['unit'] = obs.valueQuantity.unit or ''
-                    elif obs.valueString:
-                        obs_data['value'] = obs.valueString
-                    elif obs.valueCodeableConcept and obs.valueCodeableConcept.text:
-                        obs_data['value'] = obs.valueCodeableConcept.text
-                    
-                    detailed_obs.append(obs_data)
-            except Exception as e:
-                app.logger.error(f"Error processing observation: {e}")
+        # `_get_observations` already yields only Observation resources
+        detailed_obs = list(map(_obs_summary, _get_observations(smart)))
         
         return jsonify({'observations': detailed_obs, 'session_token': token})
         
     except Exception as e:
-        app.logger.error(f"Error getting detailed observations: {e}")
+        app.logger.error("Error getting detailed observations: %s", e)
         return jsonify({'error': 'Failed to retrieve observations', 'details': str(e)}), 500
 
+# Static parts of the Epic write-permission responses
+_EPIC_403_BODY = {
+    'error': 'Permission denied - Epic FHIR write restrictions',
+    'epic_error_codes': {
+        '4118': 'User not authorized for request',
+        '59187': 'No patient-entered flowsheets found', 
+        '59188': 'Failed to find vital-signs flowsheet row',
+        '59189': 'Failed to file the reading'
+    },
+    'solution': 'Contact Epic customer to enable write permissions or test in sandbox'
+}
+_EPIC_REQS = {
+    'flowsheet_configured': 'Epic must have flowsheet rows for LOINC codes',
+    'vital_signs_category': 'Required for all observations',
+    'loinc_codes_supported': ('8310-5', '8480-6', '8462-4', '8867-4', '9279-1', '2708-6', '29463-7', '8302-2')
+}
+
 @app.route('/api/observations', methods=['POST'])
 @cross_origin()
 def create_observation():
     """Create a new observation with dummy defaults for missing/invalid data"""
     try:
-        token = get_session_token()
-        smart = _get_smart(token)
+        token = _req_token()
+        smart = _req_smart()
         
         if not smart or not smart.patient:
             return jsonify({'error': 'No patient data available'}), 404
@@ -1094,23 +1859,13 @@ def create_observation():
         
     except Exception as e:
         error_msg = str(e)
-        app.logger.error(f"Error creating observation: {error_msg}")
+        app.logger.error("Error creating observation: %s", error_msg)
         
-        token = get_session_token()
+        token = _req_token()
         
         # Handle specific Epic FHIR errors
         if '403' in error_msg or 'Forbidden' in error_msg:
-            return jsonify({
-                'error': 'Permission denied - Epic FHIR write restrictions',
-                'epic_error_codes': {
-                    '4118': 'User not authorized for request',
-                    '59187': 'No patient-entered flowsheets found', 
-                    '59188': 'Failed to find vital-signs flowsheet row',
-                    '59189': 'Failed to file the reading'
-                },
-                'solution': 'Contact Epic customer to enable write permissions or test in sandbox',
-                'session_token': token
-            }), 403
+            return jsonify({**_EPIC_403_BODY, 'session_token': token}), 403
         else:
             return jsonify({
                 'error': f'Failed to create observation: {error_msg}',
@@ -1122,8 +1877,8 @@ def create_observation():
 def update_observation(observation_id):
     """Update an existing observation"""
     try:
-        token = get_session_token()
-        smart = _get_smart(token)
+        token = _req_token()
+        smart = _req_smart()
         
         if not smart or not smart.patient:
             return jsonify({'error': 'No patient data available'}), 404
@@ -1144,52 +1899,54 @@ def update_observation(observation_id):
             'session_token': token
         })
     except Exception as e:
-        app.logger.error(f"Error updating observation: {e}")
-        token = get_session_token()
+        app.logger.error("Error updating observation: %s", e)
+        token = _req_token()
         return jsonify({
             'error': f'Failed to update observation: {str(e)}',
             'session_token': token
         }), 500
 
+# Either the user- or patient-level scope grants an observation permission
+_READ_SCOPES = frozenset({'user/Observation.read', 'patient/Observation.read'})
+_WRITE_SCOPES = frozenset({'user/Observation.write', 'patient/Observation.write'})
+_CREATE_SCOPES = frozenset({'user/Observation.create', 'patient/Observation.create'})
+
 @app.route('/api/check-permissions')
 @cross_origin()
 def check_permissions():
     """Check what permissions your app actually has"""
     try:
-        token = get_session_token()
-        smart = _get_smart(token)
+        token = _req_token()
+        smart = _req_smart()
         
         if not smart:
             return jsonify({'error': 'No SMART client available'}), 404
         
-        if token not in active_sessions:
+        session_data = get_session_from_db(token)
+        if not session_data:
             return jsonify({'error': 'Session not found'}), 404
         
-        session_data = active_sessions[token]
         state = session_data.get('state', {})
         token_response = state.get('tokenResponse', {}) if isinstance(state, dict) else {}
         granted_scopes = token_response.get('scope', '').split(' ') if token_response.get('scope') else []
+        granted = frozenset(granted_scopes)
         
         permissions = {
             'session_token': token,
             'granted_scopes': granted_scopes,
-            'can_read_observations': any(scope in granted_scopes for scope in ['user/Observation.read', 'patient/Observation.read']),
-            'can_write_observations': any(scope in granted_scopes for scope in ['user/Observation.write', 'patient/Observation.write']),
-            'can_create_observations': any(scope in granted_scopes for scope in ['user/Observation.create', 'patient/Observation.create']),
-            'has_patient_context': 'launch/patient' in granted_scopes,
-            'has_user_context': 'fhirUser' in granted_scopes,
+            'can_read_observations': not granted.isdisjoint(_READ_SCOPES),
+            'can_write_observations': not granted.isdisjoint(_WRITE_SCOPES),
+            'can_create_observations': not granted.isdisjoint(_CREATE_SCOPES),
+            'has_patient_context': 'launch/patient' in granted,
+            'has_user_context': 'fhirUser' in granted,
             'patient_id': smart.patient_id if smart.patient else None,
-            'epic_requirements': {
-                'flowsheet_configured': 'Epic must have flowsheet rows for LOINC codes',
-                'vital_signs_category': 'Required for all observations',
-                'loinc_codes_supported': ['8310-5', '8480-6', '8462-4', '8867-4', '9279-1', '2708-6', '29463-7', '8302-2']
-            }
+            'epic_requirements': _EPIC_REQS
         }
         
         return jsonify(permissions)
         
     except Exception as e:
-        app.logger.error(f"Error checking permissions: {e}")
+        app.logger.error("Error checking permissions: %s", e)
         return jsonify({'error': f'Failed to check permissions: {str(e)}'}), 500
 
 @app.route('/api/logout', methods=['POST'])
@@ -1197,7 +1954,7 @@ def check_permissions():
 def api_logout():
     """Logout current session"""
     try:
-        token = get_session_token()
+        token = _req_token()
         old_token = token
         _logout(token)
         
@@ -1207,7 +1964,7 @@ def api_logout():
             'previous_session_token': old_token
         })
     except Exception as e:
-        app.logger.error(f"Error in logout: {e}")
+        app.logger.error("Error in logout: %s", e)
         return jsonify({
             'success': False,
             'message': 'Logout completed with errors',
@@ -1219,7 +1976,7 @@ def api_logout():
 def api_reset():
     """Reset current session"""
     try:
-        token = get_session_token()
+        token = _req_token()
         old_token = token
         _reset_session(token)
         
@@ -1230,50 +1987,73 @@ def api_reset():
             'previous_state_cleared': True
         })
     except Exception as e:
-        app.logger.error(f"Error in reset: {e}")
+        app.logger.error("Error in reset: %s", e)
         return jsonify({
             'success': False,
             'message': 'Reset completed with errors',
             'error': str(e)
         })
 
+SESSION_PAGE_SIZE = 40
+MAX_SESSION_PAGE_SIZE = 200
+
 @app.route('/api/sessions')
 @cross_origin()
 def list_sessions():
-    """Debug endpoint to list active sessions"""
+    """Debug endpoint to list active sessions, a page at a time
+    
+    Query parameters `offset` and `limit` select the page, newest first.
+    """
     try:
-        cleanup_expired_sessions_db()
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        limit = min(max(request.args.get('limit', SESSION_PAGE_SIZE, type=int), 1), MAX_SESSION_PAGE_SIZE)
         
-        session_info = {}
-        all_sessions = get_all_sessions()
-        for token, data in all_sessions.items():
-            session_info[token[:8] + "..."] = {
+        # Datetimes are left to orjson, which writes them as ISO 8601 with
+        # an explicit +00:00 offset (the stored values are naive UTC)
+        session_info = {
+            token[:8] + "...": {
                 'session_id': data.get('session_id'),
-                'created_at': data.get('created_at').isoformat() if data.get('created_at') else None,
-                'last_accessed': data.get('last_accessed').isoformat() if data.get('last_accessed') else None,
-                'expires_at': data.get('expires_at').isoformat() if data.get('expires_at') else None,
+                'created_at': data.get('created_at'),
+                'last_accessed': data.get('last_accessed'),
+                'expires_at': data.get('expires_at'),
                 'has_patient': False,  # We don't store smart_client anymore
                 'has_tokens': bool(data.get('access_token'))
             }
+            for token, data in iter_session_summaries(offset, limit)
+        }
         
-        current_token = get_session_token()
+        current_token = _req_token()
+        total = count_sessions()
         
         return jsonify({
             'current_session_token': current_token[:8] + "..." if current_token else None,
-            'active_sessions_count': len(all_sessions),
-            'max_sessions': MAX_SESSIONS,
+            'active_sessions_count': total,
             'sessions': session_info,
+            'offset': offset,
+            'limit': limit,
+            'next_offset': offset + limit if offset + limit < total else None,
             'debug_info': {
-                'multi_session_working': len(all_sessions) >= 0,
+                'multi_session_working': True,
                 'isolation_enabled': True,
                 'auto_cleanup_enabled': True,
                 'storage_type': 'MongoDB' if sessions_collection is not None else 'In-Memory'
             }
         })
     except Exception as e:
-        app.logger.error(f"Error listing sessions: {e}")
+        app.logger.error("Error listing sessions: %s", e)
         return jsonify({'error': f'Failed to list sessions: {str(e)}'}), 500
 
+def _url_pack(d):
+    """Unpadded base64url of the JSON for `d`, for use in a query string"""
+    return base64.urlsafe_b64encode(orjson.dumps(d)).rstrip(b'=').decode('ascii')
+
+def _client_redirect(param, payload):
+    """Redirect to the client app with `payload` packed into `param`; `enc`
+    tells the client to base64url-decode it before parsing the JSON"""
+    response = redirect(f"{CLIENT_REDIRECT_URL}?{param}={_url_pack(payload)}&enc=b64url")
+    response.headers['X-Encoding'] = 'b64url'
+    return response
+
 # OAuth callback handler with multi-session support
 @app.route('/fhir-app/')
 @cross_origin()
@@ -1287,30 +2067,29 @@ def callback():
         if not token:
             state_param = request.args.get('state')
             if state_param:
-                app.logger.warning(f"Attempting session recovery with state: {state_param[:20]}...")
+                app.logger.warning("Attempting session recovery with state: %s...", state_param[:20])
                 recovered_token = find_session_by_oauth_state(state_param)
                 if recovered_token:
                     token = recovered_token
                     # Store in Flask-Session for future requests
                     session['session_token'] = token
-                    app.logger.info(f"Successfully recovered session: {token[:8]}...")
+                    app.logger.info("Successfully recovered session: %s...", token[:8])
                 else:
-                    app.logger.warning(f"No session found for OAuth state: {state_param[:20]}...")
+                    app.logger.warning("No session found for OAuth state: %s...", state_param[:20])
         
         # If still no token, create new session
         if not token:
             token = create_new_session()
             session['session_token'] = token
-            app.logger.info(f"Created new session for OAuth callback: {token[:8]}...")
+            app.logger.info("Created new session for OAuth callback: %s...", token[:8])
         
         # Validate token exists in storage
         if not get_session_from_db(token):
-            app.logger.error(f"Session validation failed for token: {token[:8]}...")
+            app.logger.error("Session validation failed for token: %s...", token[:8])
             error_data = {'success': False, 'error': 'Invalid session state - please restart the authorization flow'}
-            encoded_error = urllib.parse.quote(json.dumps(error_data))
-            return redirect(f"{CLIENT_REDIRECT_URL}?error={encoded_error}")
+            return _client_redirect('error', error_data)
         
-        app.logger.info(f"Using session token: {token[:8]}...")
+        app.logger.info("Using session token: %s...", token[:8])
         
         smart = _get_smart(token)
         if not smart:
@@ -1321,52 +2100,50 @@ def callback():
         
         # Store tokens securely on server-side
         try:
-            if hasattr(smart, 'server') and hasattr(smart.server, 'access_token'):
-                access_token = smart.server.access_token
-                refresh_token = getattr(smart.server, 'refresh_token', None)
-                expires_in = getattr(smart.server, 'expires_in', 3600)
+            # The OAuth2 tokens live on the server's auth object
+            auth = getattr(getattr(smart, 'server', None), 'auth', None)
+            access_token = getattr(auth, 'access_token', None)
+            if access_token:
+                refresh_token = getattr(auth, 'refresh_token', None)
+                expires_at = getattr(auth, 'expires_at', None)
+                # fhirclient stamps `expires_at` in local time
+                expires_in = int((expires_at - datetime.now()).total_seconds()) if expires_at else 3600
                 
                 store_tokens(token, access_token, refresh_token, expires_in)
-                app.logger.info(f"Stored tokens for session: {token[:8]}...")
+                app.logger.info("Stored tokens for session: %s...", token[:8])
         except Exception as e:
-            app.logger.error(f"Error storing tokens: {e}")
+            app.logger.error("Error storing tokens: %s", e)
         
         if smart.ready and smart.patient:
             try:
-                patient_data = _get_complete_patient_data(smart)
+                patient_summary = _get_patient_summary(smart)
                 
                 summary_data = {
                     'success': True,
-                    'patient_id': patient_data['patient_id'],
-                    'name': patient_data['demographics']['name'],
-                    'gender': patient_data['demographics']['gender'],
-                    'birth_date': patient_data['demographics']['birth_date'],
-                    'medications_count': len(patient_data['medications']),
-                    'conditions_count': len(patient_data['conditions']),
+                    'patient_id': patient_summary['patient_id'],
+                    'name': patient_summary['demographics']['name'],
+                    'gender': patient_summary['demographics']['gender'],
+                    'birth_date': patient_summary['demographics']['birth_date'],
+                    'medications_count': patient_summary['medications_count'],
+                    'conditions_count': patient_summary['conditions_count'],
                     'session_token': token
                 }
                 
-                encoded_data = urllib.parse.quote(json.dumps(summary_data))
-                redirect_url = f"{CLIENT_REDIRECT_URL}?data={encoded_data}"
-                
-                app.logger.info(f"OAuth success for session {token[:8]}..., redirecting to client")
-                return redirect(redirect_url)
+                app.logger.info("OAuth success for session %s..., redirecting to client", token[:8])
+                return _client_redirect('data', summary_data)
             except Exception as e:
-                app.logger.error(f"Error processing patient data in callback: {e}")
+                app.logger.error("Error processing patient data in callback: %s", e)
                 error_data = {'success': False, 'error': f'Failed to process patient data: {str(e)}', 'session_token': token}
-                encoded_error = urllib.parse.quote(json.dumps(error_data))
-                return redirect(f"{CLIENT_REDIRECT_URL}?error={encoded_error}")
+                return _client_redirect('error', error_data)
         else:
             error_data = {'success': False, 'error': 'No patient data available', 'session_token': token}
-            encoded_error = urllib.parse.quote(json.dumps(error_data))
-            return redirect(f"{CLIENT_REDIRECT_URL}?error={encoded_error}")
+            return _client_redirect('error', error_data)
             
     except Exception as e:
-        app.logger.error(f"OAuth callback error: {e}")
+        app.logger.error("OAuth callback error: %s", e)
         token = session.get('session_token', 'unknown')
         error_data = {'success': False, 'error': str(e), 'session_token': token}
-        encoded_error = urllib.parse.quote(json.dumps(error_data))
-        return redirect(f"{CLIENT_REDIRECT_URL}?error={encoded_error}")
+        return _client_redirect('error', error_data)
 
 @app.route('/api/set-redirect-url', methods=['POST'])
 @cross_origin()
@@ -1374,13 +2151,13 @@ def set_redirect_url():
     """Allow client to set custom redirect URL"""
     try:
         global CLIENT_REDIRECT_URL
-        data = request.get_json()
+        data = request.get_json(silent=True)
         if data and 'redirect_url' in data:
             CLIENT_REDIRECT_URL = data['redirect_url']
             return jsonify({'success': True, 'redirect_url': CLIENT_REDIRECT_URL})
         return jsonify({'error': 'Invalid redirect URL'}), 400
     except Exception as e:
-        app.logger.error(f"Error setting redirect URL: {e}")
+        app.logger.error("Error setting redirect URL: %s", e)
         return jsonify({'error': f'Failed to set redirect URL: {str(e)}'}), 500
 
 # Legacy HTML endpoints with multi-session support
@@ -1392,198 +2169,101 @@ def index():
     try:
         cleanup_expired_sessions()
         
-        token = get_session_token()
-        smart = _get_smart(token) if token else None
-        
-        html = f"""
-        <html>
-        <head>
-            <title>Epic FHIR Multi-Session Patient Record Viewer</title>
-            <style>
-                body {{ font-family: Arial, sans-serif; margin: 20px; }}
-                .section {{ margin-bottom: 30px; border: 1px solid #ccc; padding: 15px; border-radius: 5px; }}
-                .section h2 {{ color: #2c3e50; border-bottom: 2px solid #3498db; padding-bottom: 5px; }}
-                .patient-info {{ background-color: #f8f9fa; }}
-                .session-info {{ background-color: #e8f4f8; }}
-                .multi-session-info {{ background-color: #fff3cd; border-color: #ffeaa7; }}
-                .no-data {{ color: #7f8c8d; font-style: italic; }}
-                ul {{ margin: 10px 0; }}
-                li {{ margin: 5px 0; }}
-                .error {{ color: #e74c3c; }}
-                .success {{ color: #27ae60; }}
-                .redirect-info {{ background-color: #e8f4f8; padding: 10px; margin: 10px 0; border-radius: 5px; }}
-                button {{ padding: 8px 16px; margin: 5px; cursor: pointer; }}
-                .btn-primary {{ background-color: #007bff; color: white; border: none; }}
-                .btn-danger {{ background-color: #dc3545; color: white; border: none; }}
-                .token {{ font-family: monospace; background: #f1f1f1; padding: 2px 6px; border-radius: 3px; }}
-            </style>
-        </head>
-        <body>
-        
-        <div class="section multi-session-info">
-            <h2>🔄 Multi-Session FHIR Server</h2>
-            <p><strong>Active Sessions:</strong> {len(get_all_sessions())}/{MAX_SESSIONS}</p>
-            <p><strong>Current Session:</strong> <span class="token">{token[:8] + '...' if token else 'None'}</span></p>
-            <p><strong>Session Isolation:</strong> ✅ Each session is completely independent</p>
-            <button class="btn-primary" onclick="window.open('/api/auth-url', '_blank')">🔗 New Session (New Tab)</button>
-            <button class="btn-danger" onclick="fetch('/api/reset', {{method: 'POST'}}).then(() => location.reload())">🔄 Reset Current Session</button>
-        </div>
-        """
-        
-        if smart is None or not token:
-            html += """
-            <h1>Epic FHIR Multi-Session Patient Record Viewer</h1>
-            <div class="section">
-                <p>No active session. Each browser tab/window can have its own independent FHIR session.</p>
-                <p><a href="/api/auth-url">Start New Session</a></p>
-            </div>
-            """
-        
-        elif smart and smart.ready and smart.patient is not None:
+        token = _req_token()
+        smart = _req_smart()
+        
+        demographics = None
+        medications = []
+        observations = []
+        patient_error = None
+        if smart is not None and token and smart.ready and smart.patient is not None:
             try:
-                demographics = _get_patient_demographics(smart)
-                prescriptions = _get_prescriptions(smart)
-                conditions = _get_conditions(smart)
-                observations = _get_observations(smart)
-                allergies = _get_allergies(smart)
-                procedures = _get_procedures(smart)
-                
-                html += f"""
-                <h1>Patient Record: {demographics.get('name', 'Unknown')}</h1>
-                
-                <div class="section redirect-info">
-                    <p><strong>Note:</strong> After successful OAuth, patients are automatically redirected to: <code>{CLIENT_REDIRECT_URL}</code></p>
-                    <p><strong>Session Token:</strong> <span class="token">{token[:12]}...</span></p>
-                </div>
-                
-                <div class="section patient-info">
-                    <h2>Demographics</h2>
-                    <ul>
-                        <li><strong>Name:</strong> {demographics.get('name', 'Unknown')}</li>
-                        <li><strong>Gender:</strong> {demographics.get('gender', 'Unknown')}</li>
-                        <li><strong>Date of Birth:</strong> {demographics.get('birth_date', 'Unknown')}</li>
-                        <li><strong>Address:</strong> {demographics.get('address', 'Not available')}</li>
-                        <li><strong>Phone:</strong> {demographics.get('phone', 'Not available')}</li>
-                    </ul>
-                </div>
-                
-                <div class="section">
-                    <h2>Current Medications ({len(prescriptions)})</h2>
-                """
-                
-                if prescriptions:
-                    html += "<ul>"
-                    for prescription in prescriptions:
-                        try:
-                            med_name = _get_med_name(prescription, smart)
-                            status = prescription.status if hasattr(prescription, 'status') else "Unknown status"
-                            html += f"<li>{med_name} (Status: {status})</li>"
-                        except Exception as e:
-                            html += f'<li class="error">Error processing medication: {str(e)}</li>'
-                    html += "</ul>"
-                else:
-                    html += '<p class="no-data">No prescriptions found</p>'
-                
-                html += f"""
-                </div>
-                
-                <div class="section">
-                    <h2>Recent Observations/Vitals ({len(observations)})</h2>
-                """
-                
-                if observations:
-                    html += "<ul>"
-                    for obs in observations[:10]:
-                        html += f"<li>{_format_observation(obs)}</li>"
-                    if len(observations) > 10:
-                        html += f"<li><em>... and {len(observations) - 10} more observations</em></li>"
-                    html += "</ul>"
-                else:
-                    html += '<p class="no-data">No observations found</p>'
-                
-                html += """
-                </div>
+                # Fetch what the page shows concurrently
+                futures = {
+                    'demographics': _FHIR_POOL.submit(_get_patient_demographics, smart),
+                    'prescriptions': _FHIR_POOL.submit(_get_prescriptions, smart),
+                    'observations': _FHIR_POOL.submit(_get_observations, smart),
+                }
+                demographics = futures['demographics'].result()
+                prescriptions = futures['prescriptions'].result()
+                observations = futures['observations'].result()
                 
-                <div class="section">
-                    <button class="btn-danger" onclick="fetch('/api/logout', {method: 'POST'}).then(() => location.reload())">🚪 Logout Current Session</button>
-                    <button class="btn-primary" onclick="window.open('/api/auth-url', '_blank')">➕ Open New Session</button>
-                </div>
-                """
+                med_codes = _prefetch_medications(prescriptions, smart)
+                medications = [{
+                    'name': _get_med_name(prescription, smart, med_codes),
+                    'status': getattr(prescription, 'status', None) or "Unknown status"
+                } for prescription in prescriptions]
             except Exception as e:
-                html += f'<div class="section error"><p>Error displaying patient data: {str(e)}</p></div>'
-        
-        else:
-            html += f"""
-            <h1>Epic FHIR Multi-Session Patient Record Viewer</h1>
-            <div class="section">
-                <p>Session exists but not authenticated. <a href="/api/auth-url">Click here to authenticate</a></p>
-            </div>
-            """
-        
-        # Add session list
-        html += """
-        <div class="section">
-            <h2>All Active Sessions</h2>
-            <p><a href="/api/sessions" target="_blank">View Session Details (JSON)</a></p>
-        </div>
-        
-        </body>
-        </html>
-        """
-        
-        return html
+                patient_error = str(e)
+        
+        # The page shows the visitor's own session, so it must never be
+        # shared by a proxy; the ETag lets an unchanged page revalidate as a
+        # bodiless 304
+        response = make_response(render_template(
+            'index.html',
+            smart=smart,
+            token=token,
+            active_sessions=count_sessions(),
+            session_page_size=SESSION_PAGE_SIZE,
+            client_redirect_url=CLIENT_REDIRECT_URL,
+            demographics=demographics,
+            medications=medications,
+            observations=[_format_observation(obs) for obs in observations[:10]],
+            observations_count=len(observations),
+            more_observations=max(0, len(observations) - 10),
+            patient_error=patient_error
+        ))
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.add_etag()
+        return response.make_conditional(request)
     except Exception as e:
-        app.logger.error(f"Error in index: {e}")
-        return f"""
-        <html>
-        <body>
-            <h1>Epic FHIR Multi-Session Error</h1>
-            <p>An error occurred: {str(e)}</p>
-            <p><a href="/api/reset">Reset and try again</a></p>
-        </body>
-        </html>
-        """
+        app.logger.error("Error in index: %s", e)
+        return render_template('error.html', error=e), 500
 
 @app.route('/logout')
 @cross_origin()
 def logout():
     try:
-        token = get_session_token()
+        token = _req_token()
         _logout(token)
         return redirect('/')
     except Exception as e:
-        app.logger.error(f"Error in logout route: {e}")
+        app.logger.error("Error in logout route: %s", e)
         return redirect('/')
 
 @app.route('/reset')
 @cross_origin()
 def reset():
     try:
-        token = get_session_token()
+        token = _req_token()
         _reset_session(token)
         return redirect('/')
     except Exception as e:
-        app.logger.error(f"Error in reset route: {e}")
+        app.logger.error("Error in reset route: %s", e)
         return redirect('/')
 
 # Cleanup background task (runs periodically)
 @app.route('/api/cleanup')
 @cross_origin()
 def manual_cleanup():
-    """Manual cleanup endpoint for testing"""
+    """Manual cleanup endpoint for testing
+    
+    With MongoDB the TTL index on `expires_at` removes expired sessions in the
+    background, so this only reports how many are still waiting for it.
+    """
     try:
-        all_sessions_before = get_all_sessions()
-        old_count = len(all_sessions_before)
+        old_count = count_sessions() + count_expired_sessions()
         cleanup_expired_sessions_db()
-        all_sessions_after = get_all_sessions() 
-        new_count = len(all_sessions_after)
+        expired_pending = count_expired_sessions()
+        new_count = count_sessions() + expired_pending
         
         return jsonify({
             'success': True,
             'message': f'Cleanup completed',
             'sessions_before': old_count,
             'sessions_after': new_count,
-            'sessions_removed': old_count - new_count
+            'sessions_removed': old_count - new_count,
+            'expired_pending': expired_pending
         })
     except Exception as e:
         return jsonify({'error': f'Cleanup failed: {str(e)}'}), 500
@@ -1591,8 +2271,8 @@ def manual_cleanup():
 # Global error handlers
 @app.errorhandler(500)
 def handle_500(e):
-    app.logger.error(f"Internal server error: {e}")
-    token = get_session_token() if get_session_token else None
+    app.logger.error("Internal server error: %s", e)
+    token = g.get('session_token')
     return jsonify({
         'error': 'Internal server error',
         'message': 'The server encountered an unexpected error',
@@ -1601,7 +2281,7 @@ def handle_500(e):
 
 @app.errorhandler(404)
 def handle_404(e):
-    token = get_session_token() if get_session_token else None
+    token = g.get('session_token')
     return jsonify({
         'error': 'Not found',
         'message': 'The requested endpoint was not found',
@@ -1636,10 +2316,10 @@ def debug_sessions():
     """Debug endpoint to verify MongoDB session storage"""
     try:
         # Check Flask-Session MongoDB collection
-        flask_sessions = list(db['flask_sessions'].find({}, {'_id': 0, 'data': 0}))
+        flask_sessions = list(get_mongo()['fhir_sessions']['flask_sessions'].find({}, {'_id': 0, 'data': 0}))
         
         # Check custom sessions collection
-        custom_sessions = list(sessions_collection.find({}, {'_id': 0, 'data': 0}))
+        custom_sessions = list(_sessions().find({}, {'_id': 0, 'data': 0}))
         
         return jsonify({
             'flask_sessions_count': len(flask_sessions),
@@ -1659,7 +2339,7 @@ def debug_sessions():
 #         import flaskbeaker
 #         flaskbeaker.FlaskBeaker.setup_app(app)
 #     except Exception as e:
-#         app.logger.warning(f"FlaskBeaker setup failed: {e}")
+#         app.logger.warning("FlaskBeaker setup failed: %s", e)
     
 #     logging.basicConfig(level=logging.DEBUG)
 #     app.run(debug=True, port=8000)
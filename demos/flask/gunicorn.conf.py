@@ -7,15 +7,20 @@ bind = "0.0.0.0:8000"
 backlog = 2048
 
 # Worker processes
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
+# Requests mostly wait on Epic FHIR and MongoDB, so threads (not extra
+# processes) absorb the blocking time; fewer forks also means fewer private
+# copies of the pymongo/requests state
+workers = max(2, multiprocessing.cpu_count())
+worker_class = "gthread"
+threads = 8
 worker_connections = 1000
-max_requests = 1000
-max_requests_jitter = 50
+max_requests = 2000  # Recycle workers to bound slow leaks
+max_requests_jitter = 200
 preload_app = True  # Important for session consistency
+worker_tmp_dir = "/dev/shm"  # Keep heartbeat writes off disk
 
 # Timeout
-timeout = 30
+timeout = 60  # Cover Epic latency spikes
 keepalive = 2
 
 # Logging
@@ -1,12 +1,30 @@
+import asyncio
 import json
 import requests
 import logging
 import urllib.parse as urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from .auth import FHIRAuth
 
+try:
+    import orjson as _json
+except ImportError:
+    _json = json
+
 FHIRJSONMimeType = 'application/fhir+json'
 
+# Retry policy for FHIR server connections: idempotent requests are retried
+# on gateway errors, with the final response still surfacing through
+# `raise_for_status`. A server's `Retry-After` is not honoured, since it may
+# ask for hours and would block the calling thread that long; retries only
+# wait for the short backoff.
+FHIRRetryPolicy = Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504),
+                        raise_on_status=False, respect_retry_after_header=False)
+
 logger = logging.getLogger(__name__)
 
 
@@ -41,8 +59,13 @@ class FHIRServer(object):
         self.base_uri = None
         self.aud = None
 
-        # Use a single requests Session for all "requests"
+        # Use a single requests Session for all "requests", with a connection
+        # pool large enough for `request_json_many`, retrying according to
+        # `FHIRRetryPolicy`
         self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=20, pool_maxsize=50, max_retries=FHIRRetryPolicy)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         
         # A URI can't possibly be less than 11 chars
         # make sure we end with "/", otherwise the last path component will be
@@ -161,7 +184,42 @@ class FHIRServer(object):
         """
         res = self._get(path, nosign=nosign)
         
-        return res.json()
+        # FHIR servers answer in UTF-8, so try that without requests' charset
+        # sniffing first; anything else (other encodings, invalid JSON) goes
+        # through `res.json()`, which raises requests' own JSONDecodeError
+        try:
+            return _json.loads(res.content)
+        except ValueError:
+            return res.json()
+    
+    def request_json_many(self, paths, nosign=False, max_workers=10):
+        """ Perform requests for JSON data against several relative paths
+        concurrently, over the server's pooled connections.
+        
+        :param list paths: The paths to append to `base_uri`
+        :param bool nosign: If set to True, the requests will not be signed
+        :param int max_workers: The maximum number of requests in flight
+        :throws: The first exception raised by any of the requests
+        :returns: A dict mapping each path to its decoded JSON response
+        """
+        paths = list(dict.fromkeys(paths))
+        if not paths:
+            return {}
+        
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as executor:
+            results = executor.map(lambda path: self.request_json(path, nosign=nosign), paths)
+            return dict(zip(paths, results))
+    
+    async def request_json_async(self, path, nosign=False):
+        """ Awaitable version of `request_json`. The blocking request runs on
+        the event loop's default executor, so many can be in flight at once.
+        
+        :param str path: The path to append to `base_uri`
+        :param bool nosign: If set to True, the request will not be signed
+        :throws: Exception on HTTP status >= 400
+        :returns: Decoded JSON response
+        """
+        return await asyncio.to_thread(self.request_json, path, nosign=nosign)
     
     def request_data(self, path, headers=None, nosign=False):
         """ Perform a data request data against the server's base with the
@@ -1,9 +1,15 @@
+import asyncio
+import copy
 import io
 import json
 import os
 import shutil
 import tempfile
+import threading
+import time
 import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
 import requests
 import responses
@@ -11,6 +17,24 @@ import responses
 from fhirclient import server
 
 
+# Server state shared by the tests; each server gets its own deep copy
+SERVER_STATE = {
+    'base_uri': "https://example.invalid/",
+    "auth_type": "oauth2",
+    "auth": {
+        "aud": "https://example.invalid/",
+        "registration_uri": "https://example.invalid/o2/registration",
+        "authorize_uri": "https://example.invalid/o2/authorize",
+        "redirect_uri": "https://example.invalid/o2/redirect",
+        "token_uri": "https://example.invalid/o2/token",
+        "auth_state": "931f4c31-73e2-4c04-bf6b-b7c9800312ea",
+        "app_secret": "my-secret",
+        "access_token": "my-access-token",
+        "refresh_token": "my-refresh-token",
+    },
+}
+
+
 class TestServer(unittest.TestCase):
 
     @staticmethod
@@ -22,21 +46,7 @@ class TestServer(unittest.TestCase):
 
     @staticmethod
     def create_server() -> server.FHIRServer:
-        return server.FHIRServer(None, state={
-            'base_uri': "https://example.invalid/",
-            "auth_type": "oauth2",
-            "auth": {
-                "aud": "https://example.invalid/",
-                "registration_uri": "https://example.invalid/o2/registration",
-                "authorize_uri": "https://example.invalid/o2/authorize",
-                "redirect_uri": "https://example.invalid/o2/redirect",
-                "token_uri": "https://example.invalid/o2/token",
-                "auth_state": "931f4c31-73e2-4c04-bf6b-b7c9800312ea",
-                "app_secret": "my-secret",
-                "access_token": "my-access-token",
-                "refresh_token": "my-refresh-token",
-            },
-        })
+        return server.FHIRServer(None, state=copy.deepcopy(SERVER_STATE))
 
     def testValidCapabilityStatement(self):
         with tempfile.TemporaryDirectory() as tmpdir:
@@ -102,6 +112,103 @@ class TestServer(unittest.TestCase):
 
         self.assertEqual(mock.call_count, 2)
 
+    @responses.activate(registry=responses.registries.OrderedRegistry)
+    def testRequestJsonRetries(self):
+        fhir = self.create_server()
+        fhir.prepare()
+
+        bin1 = {"resourceType": "Binary", "id": "bin1"}
+        responses.add("GET", f"{fhir.base_uri}Binary/bin1", status=503)
+        responses.add("GET", f"{fhir.base_uri}Binary/bin1", json=bin1)
+        self.assertEqual(fhir.request_json("Binary/bin1"), bin1)
+
+        for _ in range(3):
+            responses.add("GET", f"{fhir.base_uri}Binary/bin2", status=502)
+        with self.assertRaises(requests.HTTPError):
+            fhir.request_json("Binary/bin2")
+
+    def testRequestJsonIgnoresRetryAfter(self):
+        # `responses` never sleeps between retries, so serve the 503s for real
+        class Unavailable(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(503)
+                self.send_header("Retry-After", "3600")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), Unavailable)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        self.addCleanup(httpd.server_close)
+        self.addCleanup(httpd.shutdown)
+
+        fhir = server.FHIRServer(None, base_uri=f"http://127.0.0.1:{httpd.server_port}/")
+        sleeps = []
+        with mock.patch("urllib3.util.retry.time.sleep", side_effect=sleeps.append):
+            start = time.monotonic()
+            with self.assertRaises(requests.HTTPError):
+                fhir.request_json("Binary/bin1")
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertTrue(all(seconds < 1 for seconds in sleeps), sleeps)
+
+    @responses.activate
+    def testRequestJsonDecoding(self):
+        fhir = self.create_server()
+        fhir.prepare()
+
+        bin1 = {"resourceType": "Binary", "id": "bin1", "data": "Jos\u00e9"}
+        responses.add("GET", f"{fhir.base_uri}Binary/utf16", body=json.dumps(bin1).encode("utf-16"),
+                      content_type="application/fhir+json")
+        self.assertEqual(fhir.request_json("Binary/utf16"), bin1)
+
+        responses.add("GET", f"{fhir.base_uri}Binary/invalid", body=b"{not json",
+                      content_type="application/fhir+json")
+        with self.assertRaises(requests.exceptions.JSONDecodeError):
+            fhir.request_json("Binary/invalid")
+
+    @responses.activate
+    def testRequestJsonMany(self):
+        fhir = self.create_server()
+        fhir.prepare()
+
+        bin1 = {"resourceType": "Binary", "id": "bin1"}
+        bin2 = {"resourceType": "Binary", "id": "bin2"}
+        mock1 = responses.add("GET", f"{fhir.base_uri}Binary/bin1", json=bin1)
+        mock2 = responses.add("GET", f"{fhir.base_uri}Binary/bin2", json=bin2)
+
+        resp = fhir.request_json_many(["Binary/bin1", "Binary/bin2", "Binary/bin1"])
+        self.assertEqual(resp, {"Binary/bin1": bin1, "Binary/bin2": bin2})
+        self.assertEqual(mock1.call_count, 1)
+        self.assertEqual(mock2.call_count, 1)
+        self.assertEqual(mock1.calls[0].request.headers["Authorization"], "Bearer my-access-token")
+
+        self.assertEqual(fhir.request_json_many([]), {})
+
+        responses.add("GET", f"{fhir.base_uri}Binary/missing", status=404)
+        with self.assertRaises(server.FHIRNotFoundException):
+            fhir.request_json_many(["Binary/bin1", "Binary/missing"])
+
+    @responses.activate
+    def testRequestJsonAsync(self):
+        fhir = self.create_server()
+        fhir.prepare()
+
+        bin1 = {"resourceType": "Binary", "id": "bin1"}
+        bin2 = {"resourceType": "Binary", "id": "bin2"}
+        responses.add("GET", f"{fhir.base_uri}Binary/bin1", json=bin1)
+        mock = responses.add("GET", f"{fhir.base_uri}Binary/bin2", json=bin2)
+
+        async def fetch():
+            return await asyncio.gather(
+                fhir.request_json_async("Binary/bin1"),
+                fhir.request_json_async("Binary/bin2", nosign=True),
+            )
+
+        self.assertEqual(asyncio.run(fetch()), [bin1, bin2])
+        self.assertNotIn("Authorization", mock.calls[0].request.headers)
+
     @responses.activate
     def testDeleteJson(self):
         fhir = self.create_server()